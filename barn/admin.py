@@ -1,12 +1,26 @@
 import json
+import logging
+import threading
 
 from django.contrib import admin
-from django.db import transaction
-from django.utils import timezone
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 
+from . import bulk
 from .models import Schedule, Task, TaskStatus
+from .stats import estimate_count
+
+log = logging.getLogger(__name__)
+
+KEYSET_VAR = "before"
 
 try:
     from pygments import highlight
@@ -29,9 +43,151 @@ class AbstractScheduleAdmin(admin.ModelAdmin):
     list_filter = ("is_active",)
 
 
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner estimate instead of COUNT(*) for the big tables on Postgres"""
+
+    estimate_threshold = 10000
+    estimated = False
+
+    @cached_property
+    def count(self) -> int:
+        count, self.estimated = estimate_count(self.object_list, self.estimate_threshold)
+        return count
+
+
+class RunAtListFilter(admin.DateFieldListFilter):
+    """
+    Adds the conditions of the partial indexes on run_at, so the range is answered by a BitmapOr
+    of barn_task_find_next_idx and barn_task_delete_idx instead of a sequential scan.
+    """
+
+    def queryset(self, request, queryset):
+        if self.used_parameters:
+            queryset = queryset.filter(
+                Q(status=TaskStatus.QUEUED) | Q(status__in=[TaskStatus.DONE, TaskStatus.FAILED])
+            )
+        return super().queryset(request, queryset)
+
+
+class TaskChangeList(ChangeList):
+    """
+    Defers the heavy columns and pages by the keyset of the ordering instead of OFFSET when
+    the tasks are ordered by (-run_at, -pk) or -pk: "?before=<run_at>_<pk>" loads the older tasks.
+    """
+
+    def __init__(self, request, *args, **kwargs) -> None:
+        self.keyset_cursor = request.GET.get(KEYSET_VAR) or None
+        self.keyset_ordering = None
+        self.keyset_next_url = None
+        super().__init__(request, *args, **kwargs)
+        self.keyset_first_url = self.get_query_string()
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(KEYSET_VAR, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # the changed filters or ordering start from the newest tasks
+        return super().get_query_string(new_params, [*(remove or ()), KEYSET_VAR])
+
+    def get_queryset(self, request, exclude_parameters=None):
+        qs = super().get_queryset(request, exclude_parameters)
+        defer = [name for name in self.model_admin.list_defer if name not in self.list_display]
+        if defer:
+            qs = qs.defer(*defer)
+        ordering = tuple(dict.fromkeys(qs.query.order_by))
+        if ordering in (("-run_at", "-pk"), ("-pk",)):
+            self.keyset_ordering = ordering
+            if self.keyset_cursor:
+                qs = qs.filter(self._keyset_q(self.keyset_cursor))
+        return qs
+
+    def get_results(self, request) -> None:
+        super().get_results(request)
+        if self.keyset_ordering is None:
+            return
+        rows = list(self.result_list)
+        if self.multi_page and rows:
+            self.keyset_next_url = self.get_query_string({KEYSET_VAR: self._keyset_token(rows[-1])})
+
+    def _keyset_token(self, obj) -> str:
+        if self.keyset_ordering == ("-pk",):
+            return str(obj.pk)
+        return f"{obj.run_at.isoformat()}_{obj.pk}"
+
+    def _keyset_q(self, token: str) -> Q:
+        pk_field = self.lookup_opts.pk
+        try:
+            if self.keyset_ordering == ("-pk",):
+                return Q(pk__lt=pk_field.to_python(token))
+            run_at, _, pk = token.rpartition("_")
+            run_at = parse_datetime(run_at)
+            if run_at is None:
+                raise ValueError(token)
+            pk = pk_field.to_python(pk)
+        except (ValueError, ValidationError) as e:
+            raise IncorrectLookupParameters(e)
+        return Q(run_at__lt=run_at) | Q(run_at=run_at, pk__lt=pk)
+
+
 class AbstractTaskAdmin(admin.ModelAdmin):
     list_display = ("id", "run_at", "colored_status")
-    list_filter = ("status", "run_at")
+    list_filter = ("status", ("run_at", RunAtListFilter))
+    list_defer = ("error",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "admin/barn/task_change_list.html"
+
+    actions = ("requeue_tasks", "clone_tasks", "cancel_tasks")
+    bulk_chunk_size = 1000
+    # the bigger selections are processed in a thread after the response
+    bulk_background_threshold = 10000
+
+    def get_changelist(self, request, **kwargs):
+        return TaskChangeList
+
+    @admin.action(description="Requeue selected failed tasks")
+    def requeue_tasks(self, request, queryset):
+        self._bulk_action(request, queryset, bulk.requeue_tasks, "requeued")
+
+    @admin.action(description="Rerun selected failed tasks as new tasks")
+    def clone_tasks(self, request, queryset):
+        self._bulk_action(request, queryset, bulk.clone_tasks, "cloned")
+
+    @admin.action(description="Cancel selected queued tasks")
+    def cancel_tasks(self, request, queryset):
+        self._bulk_action(request, queryset, bulk.cancel_tasks, "cancelled")
+
+    def _bulk_action(self, request, queryset, func, verb: str) -> None:
+        opts = self.model._meta
+        count, estimated = estimate_count(queryset, self.bulk_background_threshold)
+        if count <= self.bulk_background_threshold:
+            done = func(queryset, self.bulk_chunk_size)
+            self.message_user(request, f"{done} {opts.verbose_name_plural} are {verb}")
+            return
+
+        def _run() -> None:
+            try:
+                func(queryset, self.bulk_chunk_size)
+            except Exception:
+                log.exception("the bulk action on %s has failed", opts.label_lower)
+            finally:
+                connections.close_all()
+
+        threading.Thread(target=_run, name=f"barn-{verb}", daemon=True).start()
+        self.message_user(
+            request,
+            f"{'About ' if estimated else ''}{count} selected {opts.verbose_name_plural} "
+            f"are being {verb} in the background",
+        )
+
+    def get_ordering(self, request):
+        # the partial indexes on run_at are used only with the status or run_at filters,
+        # otherwise the primary key is the cheap ordering
+        if any(param.startswith(("status", "run_at")) for param in request.GET):
+            return ("-run_at",)
+        return ("-pk",)
 
     @admin.display(empty_value="unknown", ordering="status")
     def colored_status(self, obj):
@@ -55,7 +211,8 @@ class ScheduleAdmin(AbstractScheduleAdmin):
     search_fields = ("name", "func")
     ordering = ("name",)
     fields = ("name", "func", "args",  "is_active",
-              "next_run_at", "interval", "cron", "last_run_at")
+              "next_run_at", "interval", "cron", "spread",
+              "misfire_policy", "max_catch_up", "last_run_at")
     readonly_fields = ()
 
     if pretty_json_field is not None:
@@ -72,22 +229,11 @@ class ScheduleAdmin(AbstractScheduleAdmin):
 class TaskAdmin(AbstractTaskAdmin):
     list_display = ("id", "func", "run_at", "colored_status")
     search_fields = ("func",)
+    list_defer = ("args", "args_data", "result", "result_data", "error")
     fields = ("func", "args", "run_at", "status", "started_at",
-              "finished_at", "result", "error")
-    readonly_fields = ()
-    actions = ("rerun_task",)
-
-    @admin.action(description="Rerun tasks")
-    @transaction.atomic
-    def rerun_task(self, request, queryset):
-        run_at = timezone.now()
-        queryset = queryset.filter(status=TaskStatus.FAILED)
-        if not queryset.exists():
-            self.message_user(request, f"Tasks in status {TaskStatus.FAILED} weren't found")
-        else:
-            for t in queryset:
-                nt = Task.objects.create(func=t.func, args=t.args, run_at=run_at)
-                self.message_user(request, f"The task {t.pk} is cloned as the task {nt.pk}")
+              "finished_at", "result", "error", "group", "chain", "payload_ref")
+    raw_id_fields = ("group",)
+    readonly_fields = ("payload_ref",)
 
     if pretty_json_field is not None:
         fields = list(fields)
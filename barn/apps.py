@@ -1,4 +1,5 @@
 from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete
 
 from barn.conf import Conf
 
@@ -9,5 +10,7 @@ class BarnConfig(AppConfig):
 
     def ready(self):
         from .models import Schedule, Task
-        from .bus import PgBus
-        PgBus.connect(Task, Schedule)
+        from .bus import get_bus_class
+        from .payloads import delete_task_payload
+        get_bus_class().connect(Task, Schedule)
+        post_delete.connect(delete_task_payload, sender=Task, dispatch_uid="barn.payloads.delete_task_payload")
@@ -0,0 +1,74 @@
+import logging
+import math
+import time
+from datetime import timedelta
+
+from .conf import Conf
+
+log = logging.getLogger(__name__)
+
+
+class Autoscaler:
+    """
+    Decides how many workers to add or remove from the queue lag and the idle workers.
+
+    The pool grows by half of its size (at least one worker) when the lag of the oldest due task
+    is above BARN_AUTOSCALE_LAG and no worker is idle, not more often than BARN_AUTOSCALE_UP_INTERVAL.
+    It shrinks by one worker when some worker has been idle and the lag has been low for
+    BARN_AUTOSCALE_DOWN_INTERVAL since the last change.
+    """
+
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        lag: timedelta | None = None,
+        up_interval: timedelta | None = None,
+        down_interval: timedelta | None = None,
+    ) -> None:
+        if min_workers < 0 or max_workers < max(min_workers, 1):
+            raise ValueError("the min and max workers are invalid")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self._lag: float = (lag or Conf.AUTOSCALE_LAG).total_seconds()
+        self._up_interval: float = (up_interval or Conf.AUTOSCALE_UP_INTERVAL).total_seconds()
+        self._down_interval: float = (down_interval or Conf.AUTOSCALE_DOWN_INTERVAL).total_seconds()
+        now = time.monotonic()
+        self._changed_at = now
+        self._quiet_since: float | None = None
+
+    def decide(self, workers: int, idle: int, lag: float, now: float | None = None) -> int:
+        """Returns the number of the workers to start (positive) or to stop (negative)"""
+        now = time.monotonic() if now is None else now
+
+        if workers < self.min_workers:
+            return self._changed(self.min_workers - workers, now)
+        if workers > self.max_workers:
+            return self._changed(self.max_workers - workers, now)
+
+        if lag >= self._lag and idle == 0:
+            self._quiet_since = None
+            if workers < self.max_workers and now - self._changed_at >= self._up_interval:
+                step = min(max(math.ceil(workers / 2), 1), self.max_workers - workers)
+                log.info("the lag is %.1fs and all %d workers are busy, start %d", lag, workers, step)
+                return self._changed(step, now)
+            return 0
+
+        if idle == 0 or lag >= self._lag / 2:
+            self._quiet_since = None
+            return 0
+        if self._quiet_since is None:
+            self._quiet_since = now
+        if (
+            workers > self.min_workers
+            and now - self._quiet_since >= self._down_interval
+            and now - self._changed_at >= self._down_interval
+        ):
+            log.info("%d of %d workers are idle, stop one", idle, workers)
+            return self._changed(-1, now)
+        return 0
+
+    def _changed(self, delta: int, now: float) -> int:
+        self._changed_at = now
+        self._quiet_since = None
+        return delta
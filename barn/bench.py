@@ -0,0 +1,36 @@
+import time
+
+from .profiling import _percentile
+
+# the tasks used by the barnbench command
+
+
+def noop(**kwargs) -> None:
+    pass
+
+
+def sleep(seconds: float = 0.1, **kwargs) -> None:
+    time.sleep(seconds)
+
+
+def cpu(iterations: int = 100000, **kwargs) -> int:
+    value = 0
+    for i in range(iterations):
+        value = (value * 31 + i) % 1000003
+    return value
+
+
+def fail(**kwargs) -> None:
+    raise RuntimeError("the benchmark task failed on purpose")
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "max": values[-1],
+    }
@@ -0,0 +1,107 @@
+import logging
+from typing import Iterator
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .bus import get_bus_class
+from .models import TaskStatus
+from .payloads import delete_tasks
+from .workflow import on_tasks_cancelled
+
+log = logging.getLogger(__name__)
+
+# the fields which are not copied to the clone of a task, the clone doesn't belong to the group
+# and gets its own copy of the out-of-row payload
+CLONE_EXCLUDE = (
+    "run_at", "status", "started_at", "finished_at", "error", "result", "result_data", "group", "payload_ref",
+)
+
+
+def requeue_tasks(queryset: QuerySet, chunk_size: int = 1000) -> int:
+    """Moves the failed tasks back to the queue in place"""
+    model = queryset.model
+    queryset = queryset.filter(status=TaskStatus.FAILED)
+    fields = {}
+    if any(field.name == "group" for field in model._meta.concrete_fields):
+        # the failure is already counted by the group
+        fields["group"] = None
+    count = 0
+    for pks in iter_pk_chunks(queryset, chunk_size):
+        with transaction.atomic():
+            count += model.objects.filter(pk__in=pks, status=TaskStatus.FAILED).update(
+                status=TaskStatus.QUEUED,
+                run_at=timezone.now(),
+                started_at=None,
+                finished_at=None,
+                error=None,
+                **fields,
+            )
+    if count:
+        get_bus_class().notify(model)
+    log.info("%d tasks are requeued", count)
+    return count
+
+
+def clone_tasks(queryset: QuerySet, chunk_size: int = 1000) -> int:
+    """Creates the new queued tasks with the same arguments as the failed tasks"""
+    model = queryset.model
+    fields = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in CLONE_EXCLUDE
+    ]
+    queryset = queryset.filter(status=TaskStatus.FAILED)
+    count = 0
+    for pks in iter_pk_chunks(queryset, chunk_size):
+        run_at = timezone.now()
+        with transaction.atomic():
+            # the instances, not values(), so the payload is decoded and encoded by the model
+            originals = list(model.objects.filter(pk__in=pks).order_by("pk"))
+            for obj in originals:
+                if hasattr(obj, "load_args"):
+                    obj.load_args()
+            clones = model.objects.bulk_create(
+                [model(run_at=run_at, **{name: getattr(obj, name) for name in fields}) for obj in originals]
+            )
+        count += len(clones)
+    if count:
+        get_bus_class().notify(model)
+    log.info("%d tasks are cloned", count)
+    return count
+
+
+def cancel_tasks(queryset: QuerySet, chunk_size: int = 1000) -> int:
+    """Deletes the queued tasks"""
+    model = queryset.model
+    has_group = any(field.name == "group" for field in model._meta.concrete_fields)
+    queryset = queryset.filter(status=TaskStatus.QUEUED)
+    count = 0
+    for pks in iter_pk_chunks(queryset, chunk_size):
+        with transaction.atomic():
+            rows = list(
+                model.objects.filter(pk__in=pks, status=TaskStatus.QUEUED)
+                .select_for_update(skip_locked=True)
+                .values_list(*(("pk", "group_id") if has_group else ("pk",)))
+            )
+            deleted = delete_tasks(model.objects.filter(pk__in=[row[0] for row in rows]))
+            if has_group:
+                # the chord callback doesn't wait for the cancelled members
+                on_tasks_cancelled(row[1] for row in rows)
+        count += deleted
+    log.info("%d tasks are cancelled", count)
+    return count
+
+
+def iter_pk_chunks(queryset: QuerySet, chunk_size: int) -> Iterator[list]:
+    """Yields the primary keys of the queryset in chunks by the keyset of pk instead of OFFSET"""
+    queryset = queryset.order_by("pk")
+    last = None
+    while True:
+        qs = queryset if last is None else queryset.filter(pk__gt=last)
+        pks = list(qs.values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks
+        last = pks[-1]
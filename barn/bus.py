@@ -1,13 +1,19 @@
 import json
 import logging
+import os
+import select
+import socket
 import threading
+import time
 from datetime import timedelta
+from pathlib import Path
 from typing import Type
 
 from django.apps import apps
-from django.db import connection
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
 from django.db.models.signals import post_save
 from django.utils import timezone
+from django.utils.module_loading import import_string
 
 from .conf import Conf
 from .models import AbstractSchedule, AbstractTask, TaskStatus
@@ -16,28 +22,43 @@ from .signals import remote_post_save
 log = logging.getLogger(__name__)
 
 
-class PgBus:
+def get_bus_class() -> Type["BaseBus"]:
+    return import_string(Conf.BUS_BACKEND)
+
+
+class BaseBus:
+    """
+    A bus delivers "something was saved" events between processes and feeds them to the
+    remote_post_save signal. Subclasses implement _run (listen) and _publish (send).
+    """
+
     def __init__(self, *listen_models: Type[AbstractTask | AbstractSchedule]) -> None:
         self._models = listen_models
         self._stop_event = threading.Event()
+        self._stop_pipe: tuple[int, int] | None = None
         self._thread: threading.Thread | None = None
 
     @property
     def name(self) -> str:
-        return "pg_bus"
+        return "bus"
 
     def start(self) -> None:
         self._stop_event.clear()
-        self._thread = threading.Thread(target=self.run, name="pg_bus")
+        self._stop_pipe = os.pipe()
+        self._thread = threading.Thread(target=self.run, name=self.name)
         self._thread.start()
 
     def stop(self) -> None:
         if self._thread and not self._stop_event.is_set():
             self._stop_event.set()
+            os.write(self._stop_pipe[1], b"\0")
             self._thread.join(10)
+            for fd in self._stop_pipe:
+                os.close(fd)
+            self._stop_pipe = None
 
     def is_alive(self) -> bool:
-        return self._thread and self._thread.is_alive()
+        return bool(self._thread and self._thread.is_alive())
 
     def run(self) -> None:
         log.info("stated")
@@ -50,52 +71,21 @@ class PgBus:
             log.info("finished")
 
     def _run(self) -> None:
-        if not self._models:
-            raise ValueError("the models is not provided")
-
-        channels = {
-            Conf.BUS_CHANNEL % {
-                "app_label": model._meta.app_label,
-                "model_name": model._meta.model_name,
-            }
-            for model in self._models
-        }
-
-        with connection.cursor() as cursor:
-            # a prepared statement is not supported for LISTEN operation
-            for channel in channels:
-                log.info("listen on %r", channel)
-                cursor.execute(f"LISTEN {channel};")
-            try:
-                con = cursor.connection
-                while not self._stop_event.is_set():
-                    cnt = 0
-                    gen = con.notifies(timeout=5)
-                    for event in gen:
-                        self._send(event)
-                        cnt += 1
-                    if cnt > 0:
-                        log.info("processed %d events", cnt)
-                    else:
-                        log.debug("i am alive...")
-            finally:
-                for channel in channels:
-                    log.info("unlisten from %s", channel)
-                    cursor.execute(f"UNLISTEN {channel};")
+        raise NotImplementedError
 
-    def _send(self, event) -> None:
-        # event: psycopg.Notify
-        log.debug("event: %s", event)
+    def _dispatch(self, payload: str) -> None:
         try:
-            payload = json.loads(event.payload)
-        except (ValueError, TypeError):
-            log.warning("invalid notification payload: %s", event.payload)
-        else:
-            model_key = payload["model"]
-            app_label, model_name = model_key.split(".")
+            data = json.loads(payload)
+            app_label, model_name = data["model"].split(".")
             model = apps.get_model(app_label, model_name)
-            instance_pk = payload["pk"]
-            remote_post_save.send(sender=self, model=model, pk=instance_pk, event=payload["event"])
+        except (ValueError, TypeError, KeyError, LookupError):
+            log.warning("invalid notification payload: %s", payload)
+        else:
+            if not any(issubclass(m, model) for m in self._models):
+                log.debug("the model %s is not listened", model)
+                return
+            remote_post_save.send(sender=self, model=model, pk=data.get("pk"), event=data.get("event"),
+                                  due=data.get("due"))
 
     @classmethod
     def connect(cls, *models: Type[AbstractTask | AbstractSchedule]) -> None:
@@ -137,16 +127,32 @@ class PgBus:
     @classmethod
     def _on_schedule_post_save(cls, sender, instance: AbstractSchedule, created: bool, **kwargs) -> None:
         log.debug("the schedule %r is created or updated: %s", instance.pk, created)
-        if not instance.is_active:
-            log.debug("the schedule %s is not active", instance)
-            return
-        if instance.next_run_at and instance.next_run_at > timezone.now():
-            log.debug("the schedule %r is in the future: %s", instance.pk, instance.next_run_at)
+        # the scheduler in the timer mode has to know about the future and inactive schedules too,
+        # the polling one skips the events which aren't due
+        due = instance.is_active and not (instance.next_run_at and instance.next_run_at > timezone.now())
+        cls._enqueue_remote_post_save(instance, created, due=due)
+
+    @classmethod
+    def notify(cls, model: Type[AbstractTask | AbstractSchedule], event: str = "bulk") -> None:
+        # used after bulk operations that do not send post_save, wakes up everyone
+        if not Conf.BUS_ENABLED:
             return
-        cls._enqueue_remote_post_save(instance, created)
+        app_label, model_name = model._meta.app_label, model._meta.model_name
+        data = {
+            "version": "1.0.0",
+            "model": f"{app_label}.{model_name}",
+            "pk": None,
+            "event": event,
+        }
+        cls._publish(app_label, model_name, json.dumps(data, ensure_ascii=False))
 
     @classmethod
-    def _enqueue_remote_post_save(cls, instance: AbstractTask | AbstractSchedule, created: bool) -> None:
+    def _enqueue_remote_post_save(
+        cls,
+        instance: AbstractTask | AbstractSchedule,
+        created: bool,
+        due: bool | None = None,
+    ) -> None:
         app_label, model_name = instance._meta.app_label, instance._meta.model_name
         data = {
             "version": "1.0.0",
@@ -154,8 +160,181 @@ class PgBus:
             "pk": instance.pk,
             "event": "create" if created else "update",
         }
+        if due is not None:
+            data["due"] = due
         payload = json.dumps(data, ensure_ascii=False)
+        cls._publish(app_label, model_name, payload)
+
+    @classmethod
+    def _publish(cls, app_label: str, model_name: str, payload: str) -> None:
+        raise NotImplementedError
+
+
+class PgBus(BaseBus):
+    keepalive_interval: float = 30.0
+    reconnect_delay: float = 0.5
+    reconnect_max_delay: float = 30.0
+
+    def __init__(self, *listen_models: Type[AbstractTask | AbstractSchedule], using: str | None = None) -> None:
+        super().__init__(*listen_models)
+        self._using = using or Conf.LISTEN_DATABASE or DEFAULT_DB_ALIAS
+        self._max_age = Conf.DB_MAX_AGE
+
+    @property
+    def name(self) -> str:
+        return "pg_bus"
+
+    def _run(self) -> None:
+        if not self._models:
+            raise ValueError("the models is not provided")
+
+        channels = {
+            Conf.BUS_CHANNEL % {
+                "app_label": model._meta.app_label,
+                "model_name": model._meta.model_name,
+            }
+            for model in self._models
+        }
+
+        connected_once = False
+        delay = self.reconnect_delay
+        while not self._stop_event.is_set():
+            try:
+                con = self._connect()
+            except Exception:
+                log.warning("cannot connect, retry in %.2fs", delay, exc_info=True)
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+            try:
+                # a prepared statement is not supported for LISTEN operation
+                for channel in channels:
+                    log.info("listen on %r", channel)
+                    con.execute(f"LISTEN {channel};")
+                delay = self.reconnect_delay
+                if connected_once:
+                    # the notifications sent during the outage are lost
+                    self._catch_up()
+                connected_once = True
+                self._listen(con)
+            except Exception:
+                if self._stop_event.is_set():
+                    break
+                log.warning("the connection is lost, reconnect in %.2fs", delay, exc_info=True)
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.reconnect_max_delay)
+            finally:
+                con.close()
+
+    def _connect(self):
+        import psycopg
+
+        params = connections[self._using].get_connection_params()
+        params.pop("cursor_factory", None)
+        params.pop("context", None)
+        return psycopg.connect(**params, autocommit=True)
+
+    def _listen(self, con) -> None:
+        stop_fd = self._stop_pipe[0]
+        recycle_at = time.monotonic() + self._max_age.total_seconds() if self._max_age else None
+        while not self._stop_event.is_set():
+            if recycle_at is not None and time.monotonic() >= recycle_at:
+                # reconnected and caught up by _run
+                log.info("recycle the connection")
+                return
+            readable, _, _ = select.select([con.fileno(), stop_fd], [], [], self.keepalive_interval)
+            if stop_fd in readable:
+                break
+            if not readable:
+                log.debug("i am alive...")
+                con.execute("SELECT 1")
+                continue
+            cnt = 0
+            for event in con.notifies(timeout=0):
+                log.debug("event: %s", event)
+                self._dispatch(event.payload)
+                cnt += 1
+            if cnt > 0:
+                log.info("processed %d events", cnt)
+
+    def _catch_up(self) -> None:
+        log.info("send catch-up events")
+        for model in self._models:
+            remote_post_save.send(sender=self, model=model, pk=None, event="reconnect")
+
+    @classmethod
+    def _publish(cls, app_label: str, model_name: str, payload: str) -> None:
         channel = Conf.BUS_CHANNEL % {"app_label": app_label, "model_name": model_name}
         log.info("a message is sent in the %s channel: %s", channel, payload)
         with connection.cursor() as cursor:
             cursor.execute("select pg_notify(%s, %s)", [channel, payload])
+
+
+class UnixSocketBus(BaseBus):
+    """
+    A same-host bus without an external service. Every listening process binds a datagram
+    socket in BARN_BUS_SOCKET_DIR and producers send each event to all sockets found there
+    after the transaction is committed.
+    """
+
+    @property
+    def name(self) -> str:
+        return "unix_bus"
+
+    def _run(self) -> None:
+        if not self._models:
+            raise ValueError("the models is not provided")
+
+        directory = Path(Conf.BUS_SOCKET_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}-{threading.get_ident()}.sock"
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.bind(str(path))
+            log.info("listen on %s", path)
+            try:
+                # the notifications sent before the socket was bound are lost
+                for model in self._models:
+                    remote_post_save.send(sender=self, model=model, pk=None, event="reconnect")
+                self._listen(sock)
+            finally:
+                log.info("unlisten from %s", path)
+                path.unlink(missing_ok=True)
+
+    def _listen(self, sock: socket.socket) -> None:
+        stop_fd = self._stop_pipe[0]
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([sock, stop_fd], [], [])
+            if stop_fd in readable:
+                break
+            cnt = 0
+            while True:
+                try:
+                    payload = sock.recv(65536, socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    break
+                self._dispatch(payload.decode())
+                cnt += 1
+            if cnt > 0:
+                log.info("processed %d events", cnt)
+
+    @classmethod
+    def _publish(cls, app_label: str, model_name: str, payload: str) -> None:
+        transaction.on_commit(lambda: cls._broadcast(payload.encode()))
+
+    @classmethod
+    def _broadcast(cls, data: bytes) -> None:
+        directory = Path(Conf.BUS_SOCKET_DIR)
+        if not directory.is_dir():
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for path in directory.glob("*.sock"):
+                try:
+                    sock.sendto(data, str(path))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    log.info("remove the stale socket %s", path)
+                    path.unlink(missing_ok=True)
+                except BlockingIOError:
+                    log.warning("the socket %s is full, the message is lost", path)
+                else:
+                    log.info("a message is sent to %s: %s", path, data)
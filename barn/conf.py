@@ -1,4 +1,7 @@
+import tempfile
 from datetime import timedelta
+from pathlib import Path
+
 from django.conf import settings
 from django.utils.functional import classproperty
 
@@ -8,15 +11,88 @@ class Conf:
     def BUS_ENABLED(cls) -> bool:
         return getattr(settings, "BARN_BUS_ENABLED", False)
 
+    @classproperty
+    def BUS_BACKEND(cls) -> str:
+        return getattr(settings, "BARN_BUS_BACKEND", "barn.bus.PgBus")
+
+    @classproperty
+    def BUS_SOCKET_DIR(cls) -> str:
+        return getattr(settings, "BARN_BUS_SOCKET_DIR", None) or str(Path(tempfile.gettempdir()) / "barn")
+
     @classproperty
     def BUS_CHANNEL(cls) -> str:
         return getattr(settings, "BARN_BUS_CHANNEL", "barn_%(app_label)s_%(model_name)s")
 
+    @classproperty
+    def RESULT_NOTIFY(cls) -> bool:
+        return getattr(settings, "BARN_RESULT_NOTIFY", False)
+
+    @classproperty
+    def RESULT_CHANNEL(cls) -> str:
+        return getattr(settings, "BARN_RESULT_CHANNEL", "barn_done_%(app_label)s_%(model_name)s")
+
+    @classproperty
+    def LISTEN_DATABASE(cls) -> str | None:
+        # a direct connection for LISTEN when the default one goes through PgBouncer in the transaction mode
+        return getattr(settings, "BARN_LISTEN_DATABASE", None)
+
+    @classproperty
+    def DB_MAX_AGE(cls) -> timedelta | None:
+        value = getattr(settings, "BARN_DB_MAX_AGE", None)
+        if not value:
+            return None
+        return as_timedelta(value, timedelta(hours=1))
+
+    @classproperty
+    def DB_IDLE_TIMEOUT(cls) -> timedelta | None:
+        value = getattr(settings, "BARN_DB_IDLE_TIMEOUT", timedelta(minutes=5))
+        if not value:
+            return None
+        return as_timedelta(value, timedelta(minutes=5))
+
+    @classproperty
+    def DB_HEALTH_CHECK_INTERVAL(cls) -> timedelta:
+        return as_timedelta(getattr(settings, "BARN_DB_HEALTH_CHECK_INTERVAL", None),
+                            timedelta(seconds=30))
+
+    @classproperty
+    def DB_TRANSACTION_POOLING(cls) -> bool:
+        return getattr(settings, "BARN_DB_TRANSACTION_POOLING", False)
+
     @classproperty
     def SCHEDULE_POLL_INTERVAL(cls) -> timedelta:
         return as_timedelta(getattr(settings, "BARN_SCHEDULE_POLL_INTERVAL", None),
                             timedelta(seconds=60))
 
+    @classproperty
+    def SCHEDULE_SPREAD(cls) -> timedelta | None:
+        value = getattr(settings, "BARN_SCHEDULE_SPREAD", None)
+        if not value:
+            return None
+        return as_timedelta(value, timedelta(0))
+
+    @classproperty
+    def SCHEDULE_TIMER(cls) -> bool:
+        return getattr(settings, "BARN_SCHEDULE_TIMER", False)
+
+    @classproperty
+    def SCHEDULE_RESYNC_INTERVAL(cls) -> timedelta:
+        return as_timedelta(getattr(settings, "BARN_SCHEDULE_RESYNC_INTERVAL", None),
+                            timedelta(minutes=10))
+
+    @classproperty
+    def SCHEDULE_BATCH_SIZE(cls) -> int:
+        return getattr(settings, "BARN_SCHEDULE_BATCH_SIZE", 500)
+
+    @classproperty
+    def SCHEDULE_MAX_CATCH_UP(cls) -> int | None:
+        return getattr(settings, "BARN_SCHEDULE_MAX_CATCH_UP", None)
+
+    @classproperty
+    def SCHEDULE_MISFIRE_GRACE_TIME(cls) -> timedelta:
+        return as_timedelta(getattr(settings, "BARN_SCHEDULE_MISFIRE_GRACE_TIME", None),
+                            timedelta(seconds=60))
+
     @classproperty
     def SCHEDULE_FINISHED_TTL(cls) -> timedelta | None:
         value = getattr(settings, "BARN_SCHEDULE_FINISHED_TTL", None)
@@ -24,6 +100,35 @@ class Conf:
             return None
         return as_timedelta(value, timedelta(days=30))
 
+    @classproperty
+    def SCHEDULE_LEADER_ELECTION(cls) -> bool:
+        return getattr(settings, "BARN_SCHEDULE_LEADER_ELECTION", False)
+
+    @classproperty
+    def SCHEDULE_SHARDING(cls) -> bool:
+        return getattr(settings, "BARN_SCHEDULE_SHARDING", False)
+
+    @classproperty
+    def LEADER_TTL(cls) -> timedelta:
+        return as_timedelta(getattr(settings, "BARN_LEADER_TTL", None),
+                            timedelta(seconds=30))
+
+    @classproperty
+    def METRICS_PORT(cls) -> int | None:
+        return getattr(settings, "BARN_METRICS_PORT", None)
+
+    @classproperty
+    def METRICS_HOST(cls) -> str:
+        return getattr(settings, "BARN_METRICS_HOST", "")
+
+    @classproperty
+    def STATS_SINK(cls) -> str | None:
+        return getattr(settings, "BARN_STATS_SINK", None)
+
+    @classproperty
+    def STATS_CACHE_TTL(cls) -> float:
+        return getattr(settings, "BARN_STATS_CACHE_TTL", 5.0)
+
     @classproperty
     def TASK_SYNC(cls) -> bool:
         return getattr(settings, "BARN_TASK_SYNC", False)
@@ -33,6 +138,45 @@ class Conf:
         return as_timedelta(getattr(settings, "BARN_TASL_POLL_INTERVAL", None),
                             timedelta(seconds=60))
 
+    @classproperty
+    def AUTOSCALE_LAG(cls) -> timedelta:
+        return as_timedelta(getattr(settings, "BARN_AUTOSCALE_LAG", None),
+                            timedelta(seconds=5))
+
+    @classproperty
+    def AUTOSCALE_UP_INTERVAL(cls) -> timedelta:
+        return as_timedelta(getattr(settings, "BARN_AUTOSCALE_UP_INTERVAL", None),
+                            timedelta(seconds=10))
+
+    @classproperty
+    def AUTOSCALE_DOWN_INTERVAL(cls) -> timedelta:
+        return as_timedelta(getattr(settings, "BARN_AUTOSCALE_DOWN_INTERVAL", None),
+                            timedelta(seconds=60))
+
+    @classproperty
+    def TASK_SERIALIZER(cls) -> str | None:
+        return getattr(settings, "BARN_TASK_SERIALIZER", None)
+
+    @classproperty
+    def TASK_COMPRESSION(cls) -> str | None:
+        return getattr(settings, "BARN_TASK_COMPRESSION", None)
+
+    @classproperty
+    def TASK_COMPRESSION_THRESHOLD(cls) -> int:
+        return getattr(settings, "BARN_TASK_COMPRESSION_THRESHOLD", 1024)
+
+    @classproperty
+    def PAYLOAD_STORAGE(cls) -> str | None:
+        return getattr(settings, "BARN_PAYLOAD_STORAGE", None)
+
+    @classproperty
+    def PAYLOAD_THRESHOLD(cls) -> int:
+        return getattr(settings, "BARN_PAYLOAD_THRESHOLD", 64 * 1024)
+
+    @classproperty
+    def PAYLOAD_DIR(cls) -> str:
+        return getattr(settings, "BARN_PAYLOAD_DIR", None) or str(Path(tempfile.gettempdir()) / "barn-payloads")
+
     @classproperty
     def TASK_FINISHED_TTL(cls) -> timedelta | None:
         value = getattr(settings, "BARN_TASK_FINISHED_TTL", None)
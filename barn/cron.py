@@ -0,0 +1,281 @@
+import calendar
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable
+
+# (min, max) of every column: second, minute, hour, day of month, month, day of week
+_SECOND = (0, 59)
+_MINUTE = (0, 59)
+_HOUR = (0, 23)
+_DAY = (1, 31)
+_MONTH = (1, 12)
+_WEEKDAY = (0, 7)
+# the end of "5/1" in the day of week column, 7 is Sunday again
+_WEEKDAY_STEP_END = 6
+
+_MONTH_NAMES = {
+    name: i for i, name in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"],
+        start=1,
+    )
+}
+_WEEKDAY_NAMES = {
+    name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])
+}
+_MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+# a cron like "0 0 30 2 *" never fires, stop searching after that many years
+_MAX_YEARS = 8
+
+# the croniter and quartz extensions: "15W" the weekday nearest to the 15th, "5#3" the third Friday,
+# "5L" or "L5" the last Friday of the month
+_NEAREST_WEEKDAY_RE = re.compile(r"^(\d+)W$")
+_NTH_WEEKDAY_RE = re.compile(r"^(\w+)#([1-5])$")
+_LAST_WEEKDAY_RE = re.compile(r"^(?:(\w+)L|L(\w+))$")
+
+
+def _next_bit(mask: int, value: int) -> int | None:
+    # the smallest set bit that is >= value
+    mask >>= value
+    if not mask:
+        return None
+    return value + (mask & -mask).bit_length() - 1
+
+
+def _parse_value(value: str, names: dict[str, int] | None) -> int:
+    if names and value.lower() in names:
+        return names[value.lower()]
+    if not value.isdigit():
+        raise ValueError(f"invalid value {value!r}")
+    return int(value)
+
+
+def _parse_field(
+    field: str, bounds: tuple[int, int], names: dict[str, int] | None = None, step_end: int | None = None
+) -> int:
+    lo, hi = bounds
+    mask = 0
+    for part in field.split(","):
+        expr, _, step = part.partition("/")
+        if step:
+            if not step.isdigit() or int(step) == 0:
+                raise ValueError(f"invalid step {part!r}")
+            step = int(step)
+        else:
+            step = 1
+        if expr in ("*", "?"):
+            start, end = lo, hi
+        elif "-" in expr:
+            start, _, end = expr.partition("-")
+            start, end = _parse_value(start, names), _parse_value(end, names)
+        else:
+            start = _parse_value(expr, names)
+            # "5/15" means "5-max/15"
+            end = (hi if step_end is None else max(start, step_end)) if part != expr else start
+        if not (lo <= start <= hi and lo <= end <= hi) or start > end:
+            raise ValueError(f"{part!r} is out of range {lo}-{hi}")
+        for value in range(start, end + 1, step):
+            mask |= 1 << value
+    return mask
+
+
+class CronExpr:
+    """
+    Compiled cron expression. Every column is stored as a bitmask of allowed values, so the next
+    fire time is found by jumping over fields instead of iterating over every minute.
+    Supports 5 columns and 6 columns (with seconds as the last one, like croniter), names of months
+    and days of week, macros like @hourly, "L", "LW" and "15W" in the day of month column and
+    "5#3", "5L" in the day of week column.
+    Like in vixie cron, a day matches any of the day columns when both of them don't start with "*"
+    and both of them otherwise.
+    """
+
+    __slots__ = (
+        "expr", "seconds", "minutes", "hours", "days", "last_day", "last_workday", "nearest_workdays",
+        "months", "weekdays", "nth_weekdays", "last_weekdays", "day_or",
+    )
+
+    def __init__(self, expr: str) -> None:
+        if not isinstance(expr, str):
+            raise TypeError("the cron expression must be a string")
+        self.expr = expr
+        fields = _MACROS.get(expr.strip().lower(), expr).split()
+        if len(fields) == 5:
+            fields.append("0")
+        if len(fields) != 6:
+            raise ValueError(f"{expr!r} must have 5 or 6 columns")
+        minute, hour, day, month, weekday, second = fields
+
+        self.seconds = _parse_field(second, _SECOND)
+        self.minutes = _parse_field(minute, _MINUTE)
+        self.hours = _parse_field(hour, _HOUR)
+        self.months = _parse_field(month, _MONTH, _MONTH_NAMES)
+
+        # "L" is the last day of a month, "LW" is its last weekday
+        self.last_day = self.last_workday = False
+        self.nearest_workdays: tuple[int, ...] = ()
+        day_parts = []
+        for part in day.upper().split(","):
+            match = _NEAREST_WEEKDAY_RE.match(part)
+            if part == "L":
+                self.last_day = True
+            elif part == "LW":
+                self.last_workday = True
+            elif match:
+                self.nearest_workdays += (_parse_value(match.group(1), None),)
+                if not _DAY[0] <= self.nearest_workdays[-1] <= _DAY[1]:
+                    raise ValueError(f"{part!r} is out of range")
+            else:
+                day_parts.append(part)
+        self.days = _parse_field(",".join(day_parts), _DAY) if day_parts else 0
+
+        self.nth_weekdays: tuple[tuple[int, int], ...] = ()
+        self.last_weekdays: tuple[int, ...] = ()
+        weekday_parts = []
+        for part in weekday.split(","):
+            nth = _NTH_WEEKDAY_RE.match(part)
+            last = _LAST_WEEKDAY_RE.match(part)
+            if nth:
+                self.nth_weekdays += ((_parse_weekday(nth.group(1)), int(nth.group(2))),)
+            elif last:
+                self.last_weekdays += (_parse_weekday(last.group(1) or last.group(2)),)
+            else:
+                weekday_parts.append(part)
+        weekdays = (
+            _parse_field(",".join(weekday_parts), _WEEKDAY, _WEEKDAY_NAMES, _WEEKDAY_STEP_END) if weekday_parts else 0
+        )
+        # 7 is Sunday too
+        if weekdays & (1 << 7):
+            weekdays = (weekdays | 1) & ~(1 << 7)
+        self.weekdays = weekdays
+
+        # like in vixie cron, the star-ness is taken from the text, so "*/2" is a star and "1-31" isn't
+        self.day_or = not day.startswith(("*", "?")) and not weekday.startswith(("*", "?"))
+
+    def __repr__(self) -> str:
+        return f"CronExpr({self.expr!r})"
+
+    def _days_mask(self, year: int, month: int) -> int:
+        ndays = calendar.monthrange(year, month)[1]
+        # the python weekday of the first day, 0 is Monday; in cron 0 is Sunday
+        first = (calendar.weekday(year, month, 1) + 1) % 7
+        week = 0
+        for i in range(7):
+            if self.weekdays & (1 << ((first + i) % 7)):
+                week |= 1 << i
+        by_weekday = 0
+        for offset in range(1, 32, 7):
+            by_weekday |= week << offset
+        for weekday, n in self.nth_weekdays:
+            day = (weekday - first) % 7 + 1 + 7 * (n - 1)
+            if day <= ndays:
+                by_weekday |= 1 << day
+        for weekday in self.last_weekdays:
+            by_weekday |= 1 << (ndays - (first + ndays - 1 - weekday) % 7)
+
+        days = self.days | (1 << ndays if self.last_day else 0)
+        if self.last_workday:
+            days |= 1 << _nearest_workday(year, month, ndays, ndays)
+        for day in self.nearest_workdays:
+            if day <= ndays:
+                days |= 1 << _nearest_workday(year, month, day, ndays)
+
+        days = days | by_weekday if self.day_or else days & by_weekday
+        return days & ((1 << (ndays + 1)) - 2)
+
+    def next(self, moment: datetime) -> datetime:
+        """The first fire time strictly after the moment"""
+        tzinfo = moment.tzinfo
+        t = moment.replace(tzinfo=None, microsecond=0) + timedelta(seconds=1)
+        limit = t.year + _MAX_YEARS
+        while t.year <= limit:
+            month = _next_bit(self.months, t.month)
+            if month is None:
+                t = datetime(t.year + 1, 1, 1)
+                continue
+            if month != t.month:
+                t = datetime(t.year, month, 1)
+
+            day = _next_bit(self._days_mask(t.year, t.month), t.day)
+            if day is None:
+                t = datetime(t.year + t.month // 12, t.month % 12 + 1, 1)
+                continue
+            if day != t.day:
+                t = datetime(t.year, t.month, day)
+
+            hour = _next_bit(self.hours, t.hour)
+            if hour is None:
+                t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+                continue
+            if hour != t.hour:
+                t = t.replace(hour=hour, minute=0, second=0)
+
+            minute = _next_bit(self.minutes, t.minute)
+            if minute is None:
+                t = t.replace(minute=0, second=0) + timedelta(hours=1)
+                continue
+            if minute != t.minute:
+                t = t.replace(minute=minute, second=0)
+
+            second = _next_bit(self.seconds, t.second)
+            if second is None:
+                t = t.replace(second=0) + timedelta(minutes=1)
+                continue
+            return t.replace(second=second, tzinfo=tzinfo)
+        raise ValueError(f"{self.expr!r} has no fire time after {moment}")
+
+    def next_many(self, moment: datetime, count: int) -> list[datetime]:
+        result = []
+        for _ in range(count):
+            moment = self.next(moment)
+            result.append(moment)
+        return result
+
+
+def _parse_weekday(value: str) -> int:
+    weekday = _parse_value(value, _WEEKDAY_NAMES)
+    if not _WEEKDAY[0] <= weekday <= _WEEKDAY[1]:
+        raise ValueError(f"{value!r} is out of range")
+    return weekday % 7
+
+
+def _nearest_workday(year: int, month: int, day: int, ndays: int) -> int:
+    # the nearest Monday-Friday within the month, like "W" in quartz
+    weekday = calendar.weekday(year, month, day)
+    if weekday == 5:
+        return day - 1 if day > 1 else day + 2
+    if weekday == 6:
+        return day + 1 if day < ndays else day - 2
+    return day
+
+
+@lru_cache(maxsize=4096)
+def compile_cron(expr: str) -> CronExpr:
+    return CronExpr(expr)
+
+
+def next_fire_time(expr: str, moment: datetime) -> datetime:
+    return compile_cron(expr).next(moment)
+
+
+def next_fire_times(items: Iterable[tuple[str, datetime]], count: int = 1) -> list[list[datetime]]:
+    """The next count fire times for many (expression, moment) pairs at once"""
+    # thousands of schedules usually share a few expressions and moments
+    cache: dict[tuple[str, datetime], list[datetime]] = {}
+    result = []
+    for key in items:
+        times = cache.get(key)
+        if times is None:
+            expr, moment = key
+            times = cache[key] = compile_cron(expr).next_many(moment, count)
+        result.append(times)
+    return result
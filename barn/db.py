@@ -0,0 +1,110 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.db import connections
+
+from .conf import Conf
+
+log = logging.getLogger(__name__)
+
+
+class ConnectionKeeper:
+    """
+    Manages the thread-local connections of a long-running loop. There is no request cycle in
+    the worker and the scheduler threads, so CONN_MAX_AGE and CONN_HEALTH_CHECKS are never applied.
+
+    The loop calls check() before the work and release() before it goes to sleep:
+
+    * a connection with an error or unused for BARN_DB_HEALTH_CHECK_INTERVAL is pinged and
+      closed when it is broken (a failover, a recycled PgBouncer connection)
+    * a connection older than BARN_DB_MAX_AGE is closed
+    * the connections are closed when the loop has done nothing for BARN_DB_IDLE_TIMEOUT
+    * with BARN_DB_TRANSACTION_POOLING the connections are closed before every sleep, they
+      are cheap to open through PgBouncer and the server connections are shared anyway
+
+    A closed connection is opened again by Django on the next query.
+    """
+
+    def __init__(
+        self,
+        max_age: timedelta | None = None,
+        idle_timeout: timedelta | None = None,
+        health_check_interval: timedelta | None = None,
+        transaction_pooling: bool | None = None,
+    ) -> None:
+        max_age = max_age or Conf.DB_MAX_AGE
+        idle_timeout = idle_timeout or Conf.DB_IDLE_TIMEOUT
+        self._max_age: float | None = max_age.total_seconds() if max_age else None
+        self._idle_timeout: float | None = idle_timeout.total_seconds() if idle_timeout else None
+        self._health_check_interval: float = (
+            health_check_interval or Conf.DB_HEALTH_CHECK_INTERVAL
+        ).total_seconds()
+        self._transaction_pooling = (
+            Conf.DB_TRANSACTION_POOLING if transaction_pooling is None else transaction_pooling
+        )
+        self._opened: dict[str, tuple[int, float]] = {}
+        self._used_at = time.monotonic()
+        self._busy_at = time.monotonic()
+        if self._transaction_pooling:
+            check_transaction_pooling()
+
+    def check(self) -> None:
+        """Closes the broken and the old connections before the work"""
+        now = time.monotonic()
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is None or conn.in_atomic_block:
+                continue
+            opened = self._opened.get(conn.alias)
+            if opened is None or opened[0] != id(conn.connection):
+                opened = self._opened[conn.alias] = (id(conn.connection), now)
+            if self._max_age is not None and now - opened[1] >= self._max_age:
+                log.info("recycle the connection %r after %.0fs", conn.alias, now - opened[1])
+                self._close(conn)
+            elif conn.errors_occurred or (
+                not self._transaction_pooling and now - self._used_at >= self._health_check_interval
+            ):
+                if conn.is_usable():
+                    conn.errors_occurred = False
+                else:
+                    log.warning("the connection %r is broken, reconnect", conn.alias)
+                    self._close(conn)
+        self._used_at = now
+
+    def release(self, busy: bool = False) -> None:
+        """Closes the connections before the loop goes to sleep if they should not be kept"""
+        now = time.monotonic()
+        if busy:
+            self._busy_at = now
+        if self._transaction_pooling:
+            self.close()
+        elif self._idle_timeout is not None and now - self._busy_at >= self._idle_timeout:
+            if any(conn.connection is not None for conn in connections.all(initialized_only=True)):
+                log.debug("idle for %.0fs, close the connections", now - self._busy_at)
+            self.close()
+
+    def close(self) -> None:
+        for conn in connections.all(initialized_only=True):
+            if not conn.in_atomic_block:
+                self._close(conn)
+
+    def _close(self, conn) -> None:
+        self._opened.pop(conn.alias, None)
+        try:
+            conn.close()
+        except Exception:
+            log.debug("cannot close the connection %r", conn.alias, exc_info=True)
+            conn.connection = None
+
+
+def check_transaction_pooling() -> None:
+    """Warns about the database settings which don't work through PgBouncer in the transaction mode"""
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        if settings_dict.get("ENGINE", "").endswith("postgresql"):
+            if not settings_dict.get("DISABLE_SERVER_SIDE_CURSORS"):
+                log.warning("the database %r must have DISABLE_SERVER_SIDE_CURSORS with the transaction pooling",
+                            alias)
+            if settings_dict.get("OPTIONS", {}).get("server_side_binding"):
+                log.warning("the database %r must not use server_side_binding with the transaction pooling",
+                            alias)
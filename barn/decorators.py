@@ -3,11 +3,11 @@ from datetime import datetime, timedelta
 from functools import wraps
 
 from django.db import transaction
-from django.db.models import JSONField, Q, Value
 from django.utils import timezone
 
 from .conf import Conf
-from .models import Task
+from .models import Task, TaskStatus, args_hash
+from .payloads import delete_tasks
 
 log = logging.getLogger(__name__)
 
@@ -31,12 +31,18 @@ def task(func):
         )
 
     @wraps(func)
-    def _cancel(**kwargs) -> bool:
+    def _cancel(**kwargs) -> int:
         return cancel_async(func, args=kwargs)
 
+    @wraps(func)
+    def _signature(**kwargs) -> dict:
+        from .workflow import signature
+        return signature(func, **kwargs)
+
     func.delay = _delay
     func.apply_async = _apply_async
     func.cancel = _cancel
+    func.s = _signature
     return func
 
 
@@ -45,7 +51,28 @@ def apply_async(
     args: dict | None = None,
     countdown: timedelta | int | float | None = None,
     eta: datetime | None = None,
+    **fields,
 ) -> Task:
+    task = make_task(func, args=args, countdown=countdown, eta=eta, **fields)
+    task.save()
+    log.info("the task %s is queued", task.pk)
+
+    if Conf.TASK_SYNC:
+        if countdown or eta:
+            raise RuntimeError("A task cannot be executed in eager mode")
+        call_on_commit(task)
+
+    return task
+
+
+def make_task(
+    func,
+    args: dict | None = None,
+    countdown: timedelta | int | float | None = None,
+    eta: datetime | None = None,
+    **fields,
+) -> Task:
+    """Returns an unsaved task, func is a function or its dotted path"""
     run_at = None
     if countdown:
         if isinstance(countdown, timedelta):
@@ -55,38 +82,55 @@ def apply_async(
     elif eta:
         run_at = eta
 
-    task = Task.objects.create(
-        func=f"{func.__module__}.{func.__name__}",
+    return Task(
+        func=func_path(func),
         args=args,
-        run_at=run_at,
+        args_hash=args_hash(args),
+        run_at=run_at or timezone.now(),
+        **fields,
     )
-    log.info("the task %s is queued", task.pk)
 
-    if Conf.TASK_SYNC:
-        if run_at:
-            raise RuntimeError("A task cannot be executed in eager mode")
 
-        def _call() -> None:
-            log.warning("run the task %s in sync mode", task)
-            from .worker import Worker
-            worker = Worker(Task)
-            worker.sync_call_task(task)
+def call_on_commit(task: Task) -> None:
+    def _call() -> None:
+        log.warning("run the task %s in sync mode", task)
+        from .worker import Worker
+        worker = Worker(Task)
+        worker.sync_call_task(task)
 
-        transaction.on_commit(_call)
+    transaction.on_commit(_call)
 
-    return task
+
+def func_path(func) -> str:
+    if isinstance(func, str):
+        return func
+    return f"{func.__module__}.{func.__name__}"
 
 
 def cancel_async(
     func,
     args: dict | None = None,
-) -> bool:
-    q = Q(func=f"{func.__module__}.{func.__name__}")
-    if args is None:
-        q &= Q(args=None) | Q(args=Value(None, JSONField()))
-    elif args:
-        # q = Q(args__contains=kwargs)
-        for key, value in args.items():
-            q &= Q(**{f"args__{key}": value})
-    deleted, _ = Task.objects.filter(q).delete()
-    return deleted > 0
+) -> int:
+    """
+    Deletes the queued tasks with exactly these arguments which aren't being processed by a worker
+    and returns the number of them.
+    """
+    with transaction.atomic():
+        from .workflow import on_tasks_cancelled
+
+        rows = list(
+            Task.objects.filter(
+                func=func_path(func),
+                args_hash=args_hash(args),
+                status=TaskStatus.QUEUED,
+            )
+            .select_for_update(skip_locked=True)
+            .values_list("pk", "group_id")
+        )
+        if not rows:
+            return 0
+        deleted = delete_tasks(Task.objects.filter(pk__in=[pk for pk, _ in rows]))
+        # the chord callback doesn't wait for the cancelled members
+        on_tasks_cancelled(group_id for _, group_id in rows)
+    log.info("%d tasks are cancelled", deleted)
+    return deleted
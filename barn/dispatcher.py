@@ -0,0 +1,88 @@
+import logging
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, Type
+
+from .models import AbstractTask
+from .signals import remote_post_save
+
+if TYPE_CHECKING:
+    from .worker import Worker
+
+log = logging.getLogger(__name__)
+
+
+class WakeupDispatcher:
+    """
+    Routes remote_post_save events to the workers of the current process.
+    Every event with a pk wakes exactly one worker (an idle one if possible) and the pk is
+    passed to it as a hint, an event without a pk wakes all workers of the model.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._workers: list["Worker"] = []
+        self._idle: deque["Worker"] = deque()
+        self._next = 0
+        self._connected = False
+
+    def connect(self) -> None:
+        if not self._connected:
+            remote_post_save.connect(self._on_remote_post_save)
+            self._connected = True
+
+    def disconnect(self) -> None:
+        if self._connected:
+            remote_post_save.disconnect(self._on_remote_post_save)
+            self._connected = False
+
+    def register(self, worker: "Worker") -> None:
+        with self._lock:
+            if worker not in self._workers:
+                self._workers.append(worker)
+
+    def unregister(self, worker: "Worker") -> None:
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if worker in self._idle:
+                self._idle.remove(worker)
+
+    def idle(self, worker: "Worker") -> None:
+        with self._lock:
+            if worker not in self._idle:
+                self._idle.append(worker)
+
+    def busy(self, worker: "Worker") -> None:
+        with self._lock:
+            if worker in self._idle:
+                self._idle.remove(worker)
+
+    def dispatch(self, model: Type[AbstractTask], pk: Any = None) -> int:
+        with self._lock:
+            workers = [w for w in self._workers if w.accepts(model)]
+            if not workers:
+                return 0
+            if pk is None:
+                for worker in workers:
+                    if worker in self._idle:
+                        self._idle.remove(worker)
+                targets = workers
+            else:
+                worker = next((w for w in self._idle if w in workers), None)
+                if worker is not None:
+                    self._idle.remove(worker)
+                else:
+                    # all workers are busy, one of them will pick the task up before sleeping
+                    self._next = (self._next + 1) % len(workers)
+                    worker = workers[self._next]
+                targets = [worker]
+        for worker in targets:
+            worker.wakeup(pk, model)
+        log.debug("woke up %d workers for %s:%s", len(targets), model, pk)
+        return len(targets)
+
+    def _on_remote_post_save(self, sender, **kwargs) -> None:
+        model = kwargs["model"]
+        if issubclass(model, AbstractTask):
+            self.dispatch(model, kwargs.get("pk"))
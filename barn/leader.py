@@ -0,0 +1,229 @@
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import Callable
+from uuid import uuid4
+
+from django.db import IntegrityError, transaction
+from django.db.models import DateTimeField, ExpressionWrapper, Q
+from django.db.models.functions import Now
+
+from .conf import Conf
+from .db import ConnectionKeeper
+from .models import SCHEDULE_SHARDS, Lease
+
+log = logging.getLogger(__name__)
+
+
+class LeaseKeeper:
+    """
+    A thread that does something with lease rows every ttl/3, the base for
+    the leader election and the shard membership.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: timedelta | None = None,
+    ) -> None:
+        self._name = name
+        self._ttl = ttl or Conf.LEADER_TTL
+        self._holder = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._db = ConnectionKeeper()
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def name(self) -> str:
+        return f"lease:{self._name}"
+
+    @property
+    def holder(self) -> str:
+        return self._holder
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name=self.name)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread and not self._stop_event.is_set():
+            self._stop_event.set()
+            self._thread.join(5)
+
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def run(self) -> None:
+        log.info("stated as %s", self._holder)
+        try:
+            self._run()
+        except:
+            log.fatal("failed")
+            raise
+        finally:
+            log.info("finished")
+
+    def _run(self) -> None:
+        interval = self._ttl.total_seconds() / 3
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self._db.check()
+                    self._beat()
+                except Exception:
+                    log.warning("cannot renew the lease %r", self._name, exc_info=True)
+                    self._lost()
+                self._db.release(busy=True)
+                self._stop_event.wait(interval)
+        finally:
+            try:
+                self.release()
+            except Exception:
+                log.warning("cannot release the lease %r", self._name, exc_info=True)
+            self._lost()
+            self._db.close()
+
+    def _beat(self) -> None:
+        raise NotImplementedError
+
+    def _lost(self) -> None:
+        raise NotImplementedError
+
+    def release(self) -> None:
+        raise NotImplementedError
+
+    def _expires_at(self) -> ExpressionWrapper:
+        return ExpressionWrapper(Now() + self._ttl, output_field=DateTimeField())
+
+
+class LeaderElection(LeaseKeeper):
+    """
+    Leader election based on a lease row. The leader renews the lease every ttl/3 and
+    the standbys try to take it over when it has expired, so a failover takes at most
+    ttl + ttl/3. The database clock is used to avoid problems with the clock skew.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: timedelta | None = None,
+        on_change: Callable[[bool], None] | None = None,
+    ) -> None:
+        super().__init__(name, ttl)
+        self._on_change = on_change
+        self._is_leader = False
+
+    @property
+    def name(self) -> str:
+        return f"leader:{self._name}"
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def _beat(self) -> None:
+        self._set_leader(self.acquire())
+
+    def _lost(self) -> None:
+        self._set_leader(False)
+
+    def _set_leader(self, is_leader: bool) -> None:
+        if is_leader == self._is_leader:
+            return
+        self._is_leader = is_leader
+        if is_leader:
+            log.info("the lease %r is acquired", self._name)
+        else:
+            log.warning("the lease %r is lost", self._name)
+        if self._on_change:
+            self._on_change(is_leader)
+
+    def acquire(self) -> bool:
+        expires_at = self._expires_at()
+        updated = Lease.objects.filter(
+            Q(holder=self._holder) | Q(expires_at__isnull=True) | Q(expires_at__lt=Now()),
+            name=self._name,
+        ).update(holder=self._holder, expires_at=expires_at)
+        if updated:
+            return True
+        if Lease.objects.filter(name=self._name).exists():
+            return False
+        try:
+            with transaction.atomic():
+                Lease.objects.create(name=self._name, holder=self._holder, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self) -> None:
+        if Lease.objects.filter(name=self._name, holder=self._holder).update(holder=None, expires_at=None):
+            log.info("the lease %r is released", self._name)
+
+
+class ShardMembership(LeaseKeeper):
+    """
+    Splits SCHEDULE_SHARDS buckets between the live members. Every member keeps its own lease
+    row named "<name>:<holder>" and owns a contiguous range of buckets according to its position
+    among the live members, so the ranges are rebalanced on the next beat after a member joins
+    or leaves. Ranges can overlap for a moment during a rebalance, the rows are locked anyway.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: timedelta | None = None,
+        on_change: Callable[[tuple[int, int] | None], None] | None = None,
+    ) -> None:
+        super().__init__(name, ttl)
+        self._on_change = on_change
+        self._shard_range: tuple[int, int] | None = None
+
+    @property
+    def name(self) -> str:
+        return f"shard:{self._name}"
+
+    @property
+    def shard_range(self) -> tuple[int, int] | None:
+        return self._shard_range
+
+    def _beat(self) -> None:
+        self._set_shard_range(self.join())
+
+    def _lost(self) -> None:
+        self._set_shard_range(None)
+
+    def _set_shard_range(self, shard_range: tuple[int, int] | None) -> None:
+        if shard_range == self._shard_range:
+            return
+        self._shard_range = shard_range
+        log.info("the shard range of %r is %s", self._name, shard_range)
+        if self._on_change:
+            self._on_change(shard_range)
+
+    def join(self) -> tuple[int, int]:
+        prefix = f"{self._name}:"
+        own = f"{prefix}{self._holder}"
+        expires_at = self._expires_at()
+        if not Lease.objects.filter(name=own).update(holder=self._holder, expires_at=expires_at):
+            Lease.objects.create(name=own, holder=self._holder, expires_at=expires_at)
+        Lease.objects.filter(name__startswith=prefix, expires_at__lt=Now()).delete()
+        members = sorted(
+            Lease.objects.filter(name__startswith=prefix, expires_at__gte=Now()).values_list("holder", flat=True)
+        )
+        if self._holder not in members:
+            members.append(self._holder)
+            members.sort()
+        return shard_range(members.index(self._holder), len(members))
+
+    def release(self) -> None:
+        Lease.objects.filter(name=f"{self._name}:{self._holder}").delete()
+        log.info("the lease %r is released", self._name)
+
+
+def shard_range(index: int, count: int) -> tuple[int, int]:
+    """The [start, end) range of buckets owned by the member with the index"""
+    return SCHEDULE_SHARDS * index // count, SCHEDULE_SHARDS * (index + 1) // count
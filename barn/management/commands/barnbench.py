@@ -0,0 +1,215 @@
+import json
+import logging
+import random
+import time
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from ... import bench
+from ...decorators import apply_async
+from ...models import Task, TaskStatus
+
+log = logging.getLogger(__name__)
+
+TASKS = {
+    "noop": bench.noop,
+    "sleep": bench.sleep,
+    "cpu": bench.cpu,
+    "fail": bench.fail,
+}
+
+
+class Command(BaseCommand):
+    help = "Enqueue benchmark tasks at a target rate and report the latency of the running workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-r",
+            "--rate",
+            dest="rate",
+            default=50.0,
+            type=float,
+            help="tasks per second",
+        )
+
+        parser.add_argument(
+            "-d",
+            "--duration",
+            dest="duration",
+            default=10.0,
+            type=float,
+            help="seconds to enqueue tasks",
+        )
+
+        parser.add_argument(
+            "-m",
+            "--mix",
+            dest="mix",
+            default="noop=1",
+            help="weights of the task kinds, e.g. noop=70,sleep=20,cpu=10",
+        )
+
+        parser.add_argument(
+            "--sleep",
+            dest="sleep",
+            default=0.1,
+            type=float,
+            help="seconds of the sleep task",
+        )
+
+        parser.add_argument(
+            "--cpu",
+            dest="cpu",
+            default=100000,
+            type=int,
+            help="iterations of the cpu task",
+        )
+
+        parser.add_argument(
+            "--soak",
+            dest="soak",
+            action="store_true",
+            help="report every --report-interval seconds while enqueuing",
+        )
+
+        parser.add_argument(
+            "--report-interval",
+            dest="report_interval",
+            default=60.0,
+            type=float,
+        )
+
+        parser.add_argument(
+            "-w",
+            "--wait",
+            dest="wait",
+            default=30.0,
+            type=float,
+            help="seconds to wait for the workers to finish the tasks",
+        )
+
+        parser.add_argument(
+            "--json",
+            dest="json",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--keep",
+            dest="keep",
+            action="store_true",
+            help="do not delete the benchmark tasks",
+        )
+
+    def handle(self, *args, **options):
+        rate = options["rate"]
+        duration = options["duration"]
+        if rate <= 0 or duration <= 0:
+            raise CommandError("the rate and the duration must be positive")
+        kinds, weights = self._parse_mix(options["mix"])
+        params = {
+            "sleep": {"seconds": options["sleep"]},
+            "cpu": {"iterations": options["cpu"]},
+        }
+
+        run_id = uuid4().hex
+        log.info("run %s: rate=%s, duration=%s, mix=%s", run_id, rate, duration, options["mix"])
+
+        started_at = timezone.now()
+        started = time.monotonic()
+        report_at = started + options["report_interval"]
+        enqueued = 0
+        while True:
+            now = time.monotonic()
+            if now - started >= duration:
+                break
+            next_at = started + enqueued / rate
+            if next_at > now:
+                time.sleep(next_at - now)
+            kind = random.choices(kinds, weights)[0]
+            apply_async(TASKS[kind], args={"bench": run_id, **params.get(kind, {})})
+            enqueued += 1
+            if options["soak"] and time.monotonic() >= report_at:
+                self._output(self._report(run_id, started_at, enqueued), options["json"])
+                report_at += options["report_interval"]
+        enqueue_seconds = time.monotonic() - started
+        enqueued_at = timezone.now()
+
+        deadline = time.monotonic() + options["wait"]
+        while time.monotonic() < deadline and self._queryset(started_at, enqueued_at).filter(status=TaskStatus.QUEUED).exists():
+            time.sleep(0.5)
+
+        report = self._report(run_id, started_at, enqueued, enqueued_at)
+        report["enqueue_rate"] = enqueued / enqueue_seconds
+        self._output(report, options["json"])
+
+        if not options["keep"]:
+            self._queryset(started_at, enqueued_at).delete()
+
+    def _parse_mix(self, mix: str) -> tuple[list[str], list[float]]:
+        kinds, weights = [], []
+        for item in mix.split(","):
+            kind, _, weight = item.strip().partition("=")
+            if kind not in TASKS:
+                raise CommandError(f"unknown task kind {kind!r}, available: {', '.join(TASKS)}")
+            try:
+                kinds.append(kind)
+                weights.append(float(weight or 1))
+            except ValueError:
+                raise CommandError(f"invalid weight in {item!r}")
+        return kinds, weights
+
+    def _queryset(self, started_at, enqueued_at=None):
+        # the tasks of the run are found by func and run_at, the args aren't in the JSON column
+        # with BARN_TASK_SERIALIZER and there is no index on them anyway
+        queryset = Task.objects.filter(
+            func__in=[f"{func.__module__}.{func.__name__}" for func in TASKS.values()],
+            run_at__gte=started_at,
+        )
+        if enqueued_at is not None:
+            queryset = queryset.filter(run_at__lte=enqueued_at)
+        return queryset
+
+    def _report(self, run_id: str, started_at, enqueued: int, enqueued_at=None) -> dict:
+        rows = list(
+            self._queryset(started_at, enqueued_at)
+            .exclude(status=TaskStatus.QUEUED)
+            .values_list("status", "run_at", "started_at", "finished_at")
+        )
+        failed = sum(1 for status, *_ in rows if status == TaskStatus.FAILED)
+        latency = [(s - r).total_seconds() for _, r, s, _ in rows if s]
+        duration = [(f - s).total_seconds() for _, _, s, f in rows if s and f]
+        bounds = self._queryset(started_at, enqueued_at).aggregate(first=Min("run_at"), last=Max("finished_at"))
+        elapsed = (bounds["last"] - bounds["first"]).total_seconds() if bounds["first"] and bounds["last"] else 0
+        return {
+            "run": run_id,
+            "elapsed": (timezone.now() - started_at).total_seconds(),
+            "enqueued": enqueued,
+            "processed": len(rows),
+            "failed": failed,
+            "failure_rate": failed / len(rows) if rows else 0,
+            "throughput": len(rows) / elapsed if elapsed else 0,
+            "latency": bench.percentiles(latency),
+            "duration": bench.percentiles(duration),
+        }
+
+    def _output(self, report: dict, as_json: bool) -> None:
+        if as_json:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(
+            "elapsed={elapsed:.1f}s enqueued={enqueued} processed={processed} failed={failed} "
+            "failure_rate={failure_rate:.2%} throughput={throughput:.1f}/s".format(**report)
+        )
+        for name in ("latency", "duration"):
+            values = report[name]
+            if values:
+                self.stdout.write(
+                    f"  {name}: p50={values['p50'] * 1000:.1f}ms p95={values['p95'] * 1000:.1f}ms "
+                    f"p99={values['p99'] * 1000:.1f}ms max={values['max'] * 1000:.1f}ms"
+                )
+        if "enqueue_rate" in report:
+            self.stdout.write(f"  enqueue rate: {report['enqueue_rate']:.1f}/s")
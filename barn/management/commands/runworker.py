@@ -6,15 +6,21 @@ from collections import Counter
 from typing import Type
 
 from django.apps import apps
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import models
 from django.utils import autoreload
 
-from ...bus import PgBus
+from ...autoscale import Autoscaler
+from ...bus import BaseBus, get_bus_class
 from ...conf import Conf
+from ...db import ConnectionKeeper
+from ...dispatcher import WakeupDispatcher
+from ...metrics import MetricsServer, WorkerMetrics
 from ...models import AbstractSchedule, AbstractTask
+from ...profiling import PercentileSink, set_stats_sink
 from ...scheduler import Scheduler
 from ...signals import post_schedule_execute, post_task_execute
+from ...stats import queue_stats
 from ...worker import Worker
 
 log = logging.getLogger(__name__)
@@ -55,11 +61,28 @@ class Command(BaseCommand):
             type=int
         )
 
+        parser.add_argument(
+            "--min-workers",
+            dest="min_workers",
+            default=None,
+            type=int,
+            help="the minimal number of the workers with --max-workers, -w by default",
+        )
+
+        parser.add_argument(
+            "--max-workers",
+            dest="max_workers",
+            default=None,
+            type=int,
+            help="scale the workers between --min-workers and this number by the queue lag",
+        )
+
         parser.add_argument(
             "-tm",
             "--task-model",
             dest="task_model",
             default=self.task_model,
+            help="the task models served by every worker, separated by commas",
         )
 
         parser.add_argument(
@@ -76,6 +99,25 @@ class Command(BaseCommand):
             action="store_true",
         )
 
+        parser.add_argument(
+            "--profile-phases",
+            dest="profile_phases",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--metrics-port",
+            dest="metrics_port",
+            default=Conf.METRICS_PORT,
+            type=int,
+        )
+
+        parser.add_argument(
+            "--metrics-host",
+            dest="metrics_host",
+            default=Conf.METRICS_HOST,
+        )
+
     def handle(self, *args, **options):
         use_reloader = options["use_reloader"]
         if use_reloader:
@@ -88,17 +130,27 @@ class Command(BaseCommand):
         use_signals = not options["use_reloader"]
         with_scheduler = options["scheduler"]
         worker_count = options["worker"]
+        max_workers = options["max_workers"]
+        if max_workers and options["min_workers"] is not None:
+            worker_count = options["min_workers"]
+        if max_workers and not 0 <= worker_count <= max_workers:
+            raise CommandError("the min workers must be between 0 and --max-workers")
         with_bus = options["bus"]
         scheduler_model = options["scheduler_model"]
         task_model = options["task_model"]
+        metrics_port = options["metrics_port"]
+        metrics_host = options["metrics_host"]
+        profile_phases = options["profile_phases"]
 
         scheduler_model: Type[AbstractSchedule] = self._get_model(scheduler_model)
-        task_model: Type[AbstractTask] = self._get_model(task_model)
+        task_models: list[Type[AbstractTask]] = [
+            self._get_model(name.strip()) for name in task_model.split(",") if name.strip()
+        ]
 
-        log.info("run with params: scheduler=%s, scheduler_model=%s, worker=%s, task_model=%s",
-                 with_scheduler, scheduler_model, worker_count, task_model)
+        log.info("run with params: scheduler=%s, scheduler_model=%s, worker=%s, max_workers=%s, task_models=%s",
+                 with_scheduler, scheduler_model, worker_count, max_workers, task_models)
 
-        if not with_scheduler and not worker_count and not with_bus:
+        if not with_scheduler and not worker_count and not max_workers and not with_bus:
             log.warning("nothing to run")
             return
 
@@ -111,6 +163,18 @@ class Command(BaseCommand):
             for sig in [signal.SIGTERM, signal.SIGINT]:
                 signal.signal(sig, self._sig_handler)
 
+        phases_sink: PercentileSink | None = None
+        if profile_phases:
+            phases_sink = PercentileSink()
+            set_stats_sink(phases_sink)
+
+        self._metrics_server: MetricsServer | None = None
+        if metrics_port:
+            self._metrics = WorkerMetrics(task_models if worker_count > 0 or max_workers else [])
+            self._metrics.connect()
+            self._metrics_server = MetricsServer(self._metrics, metrics_host, metrics_port)
+            self._metrics_server.start()
+
         self._scheduler: Scheduler | None = None
         if with_scheduler:
             post_schedule_execute.connect(self._on_schedule_executed)
@@ -118,29 +182,38 @@ class Command(BaseCommand):
             self._scheduler.start()
             time.sleep(0.2)
 
+        self._task_models = task_models
         self._workers: list[Worker] = []
-        if worker_count > 0:
+        self._worker_seq = 0
+        self._dispatcher: WakeupDispatcher | None = None
+        if worker_count > 0 or max_workers:
             post_task_execute.connect(self._on_task_executed)
-            for i in range(worker_count):
-                worker = Worker(task_model, name=f"worker-{i}")
-                self._workers.append(worker)
-                worker.start()
+            self._dispatcher = WakeupDispatcher()
+            self._dispatcher.connect()
+            for _ in range(worker_count):
+                self._start_worker()
                 time.sleep(0.2)
 
-        self._bus: PgBus | None = None
+        self._autoscaler: Autoscaler | None = None
+        if max_workers:
+            self._autoscaler = Autoscaler(worker_count, max_workers)
+            self._db = ConnectionKeeper()
+
+        self._bus: BaseBus | None = None
         if Conf.BUS_ENABLED or with_bus:
             bus_models: list[Type[AbstractSchedule] | Type[AbstractTask]] = []
             if with_scheduler:
                 bus_models.append(scheduler_model)
-            if worker_count > 0:
-                bus_models.append(task_model)
-            self._bus = PgBus(*bus_models)
+            if self._dispatcher:
+                bus_models.extend(task_models)
+            self._bus = get_bus_class()(*bus_models)
             self._bus.start()
 
         with self._stats_lock:
             prev_stats = self._stats.copy()
 
         timeout = 1
+        report_at = time.monotonic() + 10
         while not self._stop_event.is_set():
             if not self._stop_event.wait(timeout):
                 if self.is_alive():
@@ -155,6 +228,11 @@ class Command(BaseCommand):
                         log.info("rps: %s", rps)
                     else:
                         log.debug("I am alive")
+                    if phases_sink and time.monotonic() >= report_at:
+                        log.info("phases:\n%s", phases_sink.format())
+                        report_at = time.monotonic() + 10
+                    if self._autoscaler:
+                        self._scale()
                 else:
                     break
 
@@ -164,11 +242,51 @@ class Command(BaseCommand):
         for worker in self._workers:
             worker.stop()
 
+        if self._dispatcher:
+            self._dispatcher.disconnect()
+
         if self._scheduler:
             self._scheduler.stop()
 
+        if self._metrics_server:
+            self._metrics_server.stop()
+            self._metrics.disconnect()
+
+        if self._autoscaler:
+            self._db.close()
+
+        if phases_sink:
+            self.stdout.write(phases_sink.format())
+
         log.info("stop")
 
+    def _start_worker(self) -> Worker:
+        worker = Worker(self._task_models, name=f"worker-{self._worker_seq}", dispatcher=self._dispatcher)
+        self._worker_seq += 1
+        self._workers.append(worker)
+        worker.start()
+        return worker
+
+    def _scale(self) -> None:
+        try:
+            self._db.check()
+            lag = max(queue_stats(model)["lag"] for model in self._task_models)
+        except Exception:
+            log.warning("cannot get the queue lag", exc_info=True)
+            return
+        finally:
+            self._db.release(busy=True)
+        idle = [worker for worker in self._workers if worker.is_idle()]
+        delta = self._autoscaler.decide(len(self._workers), len(idle), lag)
+        for _ in range(delta):
+            worker = self._start_worker()
+            log.info("the worker %r is started, %d workers", worker.name, len(self._workers))
+        for worker in idle[:-delta] if delta < 0 else []:
+            # only an idle worker is stopped, so no task is interrupted
+            self._workers.remove(worker)
+            worker.stop()
+            log.info("the worker %r is stopped, %d workers", worker.name, len(self._workers))
+
     def _sig_handler(self, signum, frame) -> None:
         log.info("got signal - %s", signal.strsignal(signum))
         self._stop_event.set()
@@ -179,7 +297,7 @@ class Command(BaseCommand):
 
     def is_alive(self) -> bool:
         if self._bus and not self._bus.is_alive():
-            log.error("the og_bus is died")
+            log.error("the %s is died", self._bus.name)
             return False
         if self._scheduler and not self._scheduler.is_alive():
             log.error("the scheduler is died")
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Type
+
+from django.db import connections
+
+from .models import AbstractTask
+from .signals import post_schedule_execute, post_task_execute, pre_task_execute, remote_post_save
+from .stats import queue_stats
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    items = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labels, key)} {value}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def dec(self, *labels: str, value: float = 1) -> None:
+        self.inc(*labels, value=-value)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        self._hist: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        with self._lock:
+            counts, total = self._hist.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            hist = [(key, list(counts), total[0]) for key, (counts, total) in self._hist.items()]
+        for key, counts, total in hist:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _labels(self.labels, key, 'le="%s"' % le)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {cumulative}"
+
+
+class WorkerMetrics:
+    """
+    Collects the worker and scheduler metrics from the barn signals, the queue depth is sampled
+    from the database on scrape but not more often than sample_interval.
+    """
+
+    def __init__(self, task_models: Iterable[Type[AbstractTask]] = (), sample_interval: float = 10.0) -> None:
+        self._task_models = tuple(task_models)
+        self._sample_interval = sample_interval
+        self._sampled_at = 0.0
+        self._sample_lock = threading.Lock()
+
+        self.tasks = Counter("barn_tasks_total", "Processed tasks", ("model", "func", "status"))
+        self.in_flight = Gauge("barn_tasks_in_flight", "Tasks being processed", ("model",))
+        self.latency = Histogram("barn_task_queue_latency_seconds", "Time from run_at to started_at",
+                                 ("model", "func"))
+        self.duration = Histogram("barn_task_duration_seconds", "Time from started_at to finished_at",
+                                  ("model", "func"))
+        self.schedules = Counter("barn_schedules_total", "Processed schedules", ("model",))
+        self.bus_events = Counter("barn_bus_events_total", "Received bus events", ("model", "event"))
+        self.queue_depth = Gauge("barn_queue_depth", "Due queued tasks", ("model",))
+        self.queue_lag = Gauge("barn_queue_lag_seconds", "Age of the oldest due queued task", ("model",))
+        self._metrics: list[Metric] = [
+            self.tasks, self.in_flight, self.latency, self.duration,
+            self.schedules, self.bus_events, self.queue_depth, self.queue_lag,
+        ]
+
+    def connect(self) -> None:
+        pre_task_execute.connect(self._on_pre_task_execute)
+        post_task_execute.connect(self._on_post_task_execute)
+        post_schedule_execute.connect(self._on_post_schedule_execute)
+        remote_post_save.connect(self._on_remote_post_save)
+
+    def disconnect(self) -> None:
+        pre_task_execute.disconnect(self._on_pre_task_execute)
+        post_task_execute.disconnect(self._on_post_task_execute)
+        post_schedule_execute.disconnect(self._on_post_schedule_execute)
+        remote_post_save.disconnect(self._on_remote_post_save)
+
+    def render(self) -> str:
+        self._sample()
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+    def _sample(self) -> None:
+        with self._sample_lock:
+            if time.monotonic() - self._sampled_at < self._sample_interval:
+                return
+            self._sampled_at = time.monotonic()
+            try:
+                for model in self._task_models:
+                    stats = queue_stats(model)
+                    self.queue_depth.set(stats["model"], value=stats["due"])
+                    self.queue_lag.set(stats["model"], value=stats["lag"])
+            except Exception:
+                log.warning("cannot sample the queue depth", exc_info=True)
+            finally:
+                # the scrape runs in a short-lived thread of the http server
+                connections.close_all()
+
+    def _on_pre_task_execute(self, sender, task: AbstractTask, **kwargs) -> None:
+        self.in_flight.inc(task._meta.label_lower)
+
+    def _on_post_task_execute(self, sender, task: AbstractTask, exc: Exception | None = None, **kwargs) -> None:
+        model = task._meta.label_lower
+        func = getattr(task, "func", "")
+        self.in_flight.dec(model)
+        self.tasks.inc(model, func, "failed" if exc else "done")
+        if task.started_at and task.run_at:
+            self.latency.observe(model, func, value=max((task.started_at - task.run_at).total_seconds(), 0))
+        if task.started_at and task.finished_at:
+            self.duration.observe(model, func, value=(task.finished_at - task.started_at).total_seconds())
+
+    def _on_post_schedule_execute(self, sender, schedule, **kwargs) -> None:
+        self.schedules.inc(schedule._meta.label_lower)
+
+    def _on_remote_post_save(self, sender, **kwargs) -> None:
+        self.bus_events.inc(kwargs["model"]._meta.label_lower, str(kwargs.get("event")))
+
+
+class MetricsServer:
+    def __init__(self, metrics: WorkerMetrics, host: str = "", port: int = 9100) -> None:
+        self._metrics = metrics
+        self._address = (host, port)
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def name(self) -> str:
+        return "metrics"
+
+    def start(self) -> None:
+        metrics = self._metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                log.debug(format, *args)
+
+        self._server = ThreadingHTTPServer(self._address, Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics")
+        self._thread.start()
+        log.info("the metrics are served on %s:%d", *self._server.server_address[:2])
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join(5)
+            self._server = None
+
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
@@ -0,0 +1,35 @@
+from random import randrange
+
+from django.db import migrations, models
+
+from .models import SCHEDULE_SHARDS
+
+
+def backfill_shards(app_label: str, model_name: str, batch_size: int = 1000) -> migrations.RunPython:
+    """
+    Spreads the existing schedules over the shards, AddField evaluates the random default only once
+    and all the existing rows get the same shard. Add it after AddField of the shard of a custom
+    schedule model:
+
+        operations = [
+            migrations.AddField(model_name="myschedule", name="shard", ...),
+            backfill_shards("myapp", "myschedule"),
+        ]
+    """
+
+    def _backfill(apps, schema_editor) -> None:
+        model = apps.get_model(app_label, model_name)
+        if isinstance(model._meta.pk, (models.AutoField, models.BigAutoField, models.SmallAutoField)):
+            model.objects.update(shard=models.F("pk") % SCHEDULE_SHARDS)
+            return
+        batch = []
+        for schedule in model.objects.only("pk").iterator(chunk_size=batch_size):
+            schedule.shard = randrange(SCHEDULE_SHARDS)
+            batch.append(schedule)
+            if len(batch) >= batch_size:
+                model.objects.bulk_update(batch, ["shard"])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ["shard"])
+
+    return migrations.RunPython(_backfill, migrations.RunPython.noop)
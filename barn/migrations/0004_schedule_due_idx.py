@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("barn", "0003_alter_schedule_next_run_at_alter_task_run_at_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="schedule",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["next_run_at", "id"],
+                name="barn_schedule_due_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("barn", "0004_schedule_due_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="schedule",
+            name="max_catch_up",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="The maximum number of missed runs executed at once",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="schedule",
+            name="misfire_policy",
+            field=models.CharField(
+                choices=[
+                    ("run_all", "Run all missed"),
+                    ("coalesce", "Run once"),
+                    ("skip", "Skip missed"),
+                ],
+                default="run_all",
+                help_text="What to do with the runs missed while the scheduler was down",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:13
+
+import barn.models
+from barn.models import SCHEDULE_SHARDS
+from django.db import migrations, models
+
+
+def spread_shards(apps, schema_editor):
+    # the default is evaluated once for the existing rows
+    model = apps.get_model("barn", "schedule")
+    model.objects.update(shard=models.F("id") % SCHEDULE_SHARDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("barn", "0006_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="schedule",
+            name="shard",
+            field=models.PositiveSmallIntegerField(
+                default=barn.models.random_shard, editable=False
+            ),
+        ),
+        migrations.RunPython(spread_shards, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="schedule",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["shard", "next_run_at"],
+                name="barn_schedule_shard_due_idx",
+            ),
+        ),
+    ]
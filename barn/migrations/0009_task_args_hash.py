@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:27
+
+from django.db import migrations, models
+
+from barn.models import args_hash
+
+
+def fill_args_hash(apps, schema_editor):
+    # only the queued tasks can be cancelled
+    model = apps.get_model("barn", "task")
+    batch = []
+    for task in model.objects.filter(status="Q").only("args").iterator(chunk_size=1000):
+        task.args_hash = args_hash(task.args)
+        batch.append(task)
+        if len(batch) >= 1000:
+            model.objects.bulk_update(batch, ["args_hash"])
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, ["args_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("barn", "0008_schedule_spread"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="args_hash",
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_args_hash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("status", "Q")),
+                fields=["func", "args_hash"],
+                name="barn_task_args_hash_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("barn", "0010_taskgroup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="args_data",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="result_data",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("barn", "0011_task_payload_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskPayload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="payload_ref",
+            field=models.CharField(blank=True, editable=False, max_length=200, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:09
+
+import barn.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("barn", "0013_alter_task_args"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="task",
+            name="result",
+            field=barn.models.PayloadJSONField(blank=True, null=True),
+        ),
+    ]
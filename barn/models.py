@@ -1,4 +1,9 @@
+import hashlib
+import json
 import logging
+import zlib
+from datetime import timedelta
+from random import randrange
 
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -6,16 +11,25 @@ from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy
 
+from . import payloads, serializers
+from .conf import Conf
+from .cron import compile_cron
+
 log = logging.getLogger(__name__)
 
+# the number of buckets the schedules are spread over for the sharded scheduler
+SCHEDULE_SHARDS = 1024
+
+
+def args_hash(args: dict | None) -> str:
+    """The fingerprint of the task arguments: sha256 of the canonical JSON, None is the same as {}"""
+    data = json.dumps(args or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
 
 def validate_cron(value):
     try:
-        from croniter import croniter
-    except ImportError:
-        raise ValidationError("croniter is not installed")
-    try:
-        croniter(value)
+        compile_cron(value)
     except (ValueError, TypeError) as err:
         raise ValidationError(
             "%(value)r is invalid cron value",
@@ -23,13 +37,35 @@ def validate_cron(value):
         ) from err
 
 
+def random_shard() -> int:
+    return randrange(SCHEDULE_SHARDS)
+
+
+class MisfirePolicy(models.TextChoices):
+    RUN_ALL = "run_all", gettext_lazy("Run all missed")
+    COALESCE = "coalesce", gettext_lazy("Run once")
+    SKIP = "skip", gettext_lazy("Skip missed")
+
+
 class AbstractSchedule(models.Model):
+    # the fields saved by the scheduler with bulk_update after process_many(), None means all of them;
+    # a subclass can list the fields changed by its process() and the signal receivers besides
+    # is_active, next_run_at and last_run_at to make the update smaller
+    process_update_fields: tuple[str, ...] | None = None
+
     is_active = models.BooleanField(default=True)
     next_run_at = models.DateTimeField(null=True, blank=True)
     interval = models.DurationField(null=True, blank=True)
     cron = models.CharField(max_length=200, null=True, blank=True, validators=[validate_cron],
                             help_text="Exactly 5 or 6 columns has to be specified for iterator expression")
     last_run_at = models.DateTimeField(null=True, blank=True)
+    misfire_policy = models.CharField(max_length=10, choices=MisfirePolicy.choices, default=MisfirePolicy.RUN_ALL,
+                                      help_text="What to do with the runs missed while the scheduler was down")
+    max_catch_up = models.PositiveIntegerField(null=True, blank=True,
+                                               help_text="The maximum number of missed runs executed at once")
+    shard = models.PositiveSmallIntegerField(default=random_shard, editable=False)
+    spread = models.DurationField(null=True, blank=True,
+                                  help_text="The cron runs are shifted by a stable offset within this window")
 
     class Meta:
         abstract = True
@@ -50,6 +86,20 @@ class AbstractSchedule(models.Model):
     def process(self) -> None:
         raise NotImplementedError
 
+    def spread_offset(self, window: timedelta | None) -> timedelta:
+        # a stable offset within the window, the python hash() is randomized per process
+        if not window or self.pk is None:
+            return timedelta(0)
+        h = zlib.crc32(f"{self._meta.label_lower}:{self.pk}".encode())
+        return timedelta(seconds=int(window.total_seconds() * h / 2 ** 32))
+
+    @classmethod
+    def process_many(cls, schedules: list["AbstractSchedule"]) -> None:
+        # the scheduler saves the schedules with bulk_update after this call,
+        # override it to process a batch of schedules at once
+        for schedule in schedules:
+            schedule.process()
+
 
 class TaskStatus(models.TextChoices):
     QUEUED = "Q", gettext_lazy("Queued")
@@ -77,12 +127,43 @@ class AbstractTask(models.Model):
     def process(self) -> None:
         raise NotImplementedError
 
+    def on_finished(self) -> None:
+        """Called by the worker in the transaction of the task after it is saved as done or failed"""
+        pass
+
+    def wait(self, timeout: float | None = None) -> "AbstractTask":
+        """Waits until the task is processed and returns it reloaded, raises TimeoutError"""
+        from .result import wait
+        return wait(self, timeout)
+
+    async def await_(self, timeout: float | None = None) -> "AbstractTask":
+        from .result import await_
+        return await await_(self, timeout)
+
 
 class Schedule(AbstractSchedule):
+    process_update_fields = ()
+
     name = models.CharField(max_length=100, null=True, blank=True)
     func = models.CharField(max_length=1000)
     args = models.JSONField(null=True, blank=True)
 
+    class Meta(AbstractSchedule.Meta):
+        indexes = [
+            # used by barn.scheduler
+            models.Index(
+                name="barn_schedule_due_idx",
+                fields=("next_run_at", "id"),
+                condition=models.Q(is_active=True),
+            ),
+            # used by barn.scheduler in the sharded mode
+            models.Index(
+                name="barn_schedule_shard_due_idx",
+                fields=("shard", "next_run_at"),
+                condition=models.Q(is_active=True),
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"{self.name}"
 
@@ -94,11 +175,90 @@ class Schedule(AbstractSchedule):
         task = Task.objects.create(run_at=self.next_run_at, func=self.func, args=self.args)
         log.info("the task %s is created for schedule %s", task.pk, self.pk)
 
+    @classmethod
+    def process_many(cls, schedules: list["Schedule"]) -> None:
+        from .bus import get_bus_class
+
+        now = timezone.now()
+        tasks = Task.objects.bulk_create(
+            [
+                Task(
+                    run_at=schedule.next_run_at or now,
+                    func=schedule.func,
+                    args=schedule.args,
+                    args_hash=args_hash(schedule.args),
+                )
+                for schedule in schedules
+            ],
+            batch_size=1000,
+        )
+        log.info("%d tasks are created for %d schedules", len(tasks), len(schedules))
+        get_bus_class().notify(Task)
+
+
+class TaskGroup(models.Model):
+    # the number of the members which aren't finished yet
+    pending = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # the signature of the chord callback: {"func": ..., "args": ...}
+    callback = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"group:{self.pk}"
+
+
+class TaskPayload(models.Model):
+    # the out-of-row args of barn.payloads.DatabaseStorage
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"payload:{self.pk}"
+
+
+class PayloadJSONField(models.JSONField):
+    """
+    The JSON column of args or result, it isn't written when the value is in the binary column
+    (BARN_TASK_SERIALIZER) or the args are in barn.payloads storage. It's still read for the old rows.
+    """
+
+    def pre_save(self, model_instance, add):
+        if getattr(model_instance, f"{self.attname}_data", None) is not None:
+            return None
+        if self.attname == "args" and getattr(model_instance, "payload_ref", None):
+            return None
+        return super().pre_save(model_instance, add)
+
+
+class TaskQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            if obj.args is not None or not obj.payload_ref:
+                obj.args_hash = args_hash(obj.args)
+            obj._pack_payload()
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class Task(AbstractTask):
+    # the payload fields and their binary columns used with BARN_TASK_SERIALIZER
+    PAYLOAD_FIELDS = (("args", "args_data"), ("result", "result_data"))
+
     func = models.CharField(max_length=1000)
-    args = models.JSONField(null=True, blank=True)
-    result = models.JSONField(null=True, blank=True)
+    args = PayloadJSONField(null=True, blank=True)
+    args_data = models.BinaryField(null=True, blank=True, editable=False)
+    args_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # the reference to the args in barn.payloads storage, they are loaded by process()
+    payload_ref = models.CharField(max_length=200, null=True, blank=True, editable=False)
+    result = PayloadJSONField(null=True, blank=True)
+    result_data = models.BinaryField(null=True, blank=True, editable=False)
+    group = models.ForeignKey(TaskGroup, null=True, blank=True, on_delete=models.SET_NULL, related_name="tasks")
+    # the signatures of the next steps of the chain
+    chain = models.JSONField(null=True, blank=True)
+
+    objects = TaskQuerySet.as_manager()
 
     class Meta(AbstractTask.Meta):
         indexes = [
@@ -114,11 +274,95 @@ class Task(AbstractTask):
                 fields=("run_at", ),
                 condition=models.Q(status=TaskStatus.QUEUED),
             ),
+            # used by barn.decorators.cancel_async
+            models.Index(
+                name="barn_task_args_hash_idx",
+                fields=("func", "args_hash"),
+                condition=models.Q(status=TaskStatus.QUEUED),
+            ),
         ]
 
     def __str__(self) -> str:
         return f"{self.func}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        for name, data_name in cls.PAYLOAD_FIELDS:
+            data = instance.__dict__.get(data_name)
+            if data is not None:
+                instance.__dict__[name] = serializers.loads(data)
+        return instance
+
+    def save(self, *args, **kwargs) -> None:
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "args" in update_fields:
+            if self.args is not None or not self.payload_ref:
+                self.args_hash = args_hash(self.args)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "args_hash", "payload_ref"}
+        if update_fields is not None:
+            kwargs["update_fields"] = {
+                *kwargs["update_fields"],
+                *(data_name for name, data_name in self.PAYLOAD_FIELDS if name in update_fields),
+            }
+        self._pack_payload()
+        super().save(*args, **kwargs)
+
+    def _pack_payload(self) -> None:
+        """
+        Fills the binary columns and moves the large args to the payload storage, args and result
+        stay on the instance, the JSON columns are left empty then.
+        """
+        codec = serializers.get_codec()
+        deferred = self.get_deferred_fields()
+        for name, data_name in self.PAYLOAD_FIELDS:
+            if name in deferred:
+                continue
+            value = getattr(self, name)
+            data = codec.dumps(value) if codec is not None and value is not None else None
+            if name == "args" and self._pack_args_out_of_row(value, data):
+                data = None
+            setattr(self, data_name, data)
+
+    def _pack_args_out_of_row(self, value, data: bytes | None) -> bool:
+        if self.payload_ref:
+            if value is None or value is getattr(self, "_loaded_args", None):
+                # not loaded or not changed
+                return True
+            payloads.delete_refs([self.payload_ref])
+            self.payload_ref = None
+        storage = payloads.get_storage()
+        if storage is None or value is None:
+            return False
+        data = data or serializers.dumps(value)
+        if len(data) < Conf.PAYLOAD_THRESHOLD:
+            return False
+        self.payload_ref = storage.save(data)
+        self._loaded_args = value
+        return True
+
+    def load_args(self) -> dict | None:
+        """Returns args, the out-of-row payload is loaded on the first call"""
+        if self.args is None and self.payload_ref:
+            data = payloads.get_storage_for(self.payload_ref).load(self.payload_ref)
+            self.args = self._loaded_args = serializers.loads(data)
+        return self.args
+
     def process(self) -> None:
         func = import_string(self.func)
-        self.result = func(**(self.args or {}))
+        self.result = func(**(self.load_args() or {}))
+
+    def on_finished(self) -> None:
+        if self.chain or self.group_id:
+            from .workflow import on_task_finished
+            on_task_finished(self)
+
+
+class Lease(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    holder = models.CharField(max_length=200, null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.name}"
@@ -0,0 +1,140 @@
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from uuid import uuid4
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils.module_loading import import_string
+
+from .conf import Conf
+
+log = logging.getLogger(__name__)
+
+
+class PayloadStorage:
+    """
+    Keeps the large task arguments out of the task table (the claim-check pattern),
+    a reference is "<prefix>:<key>" so it is loaded by the storage which has saved it.
+    """
+
+    prefix: str
+
+    def save(self, data: bytes) -> str:
+        raise NotImplementedError
+
+    def load(self, ref: str) -> bytes:
+        raise NotImplementedError
+
+    def delete(self, refs: list[str]) -> None:
+        raise NotImplementedError
+
+
+class DatabaseStorage(PayloadStorage):
+    prefix = "db"
+
+    def save(self, data: bytes) -> str:
+        from .models import TaskPayload
+        payload = TaskPayload.objects.create(data=data)
+        return f"{self.prefix}:{payload.pk}"
+
+    def load(self, ref: str) -> bytes:
+        from .models import TaskPayload
+        return bytes(TaskPayload.objects.values_list("data", flat=True).get(pk=_key(ref)))
+
+    def delete(self, refs: list[str]) -> None:
+        from .models import TaskPayload
+        TaskPayload.objects.filter(pk__in=[_key(ref) for ref in refs]).delete()
+
+
+class FileSystemStorage(PayloadStorage):
+    prefix = "file"
+
+    def __init__(self, location: str | None = None) -> None:
+        self._location = location
+
+    @property
+    def location(self) -> Path:
+        return Path(self._location or Conf.PAYLOAD_DIR)
+
+    def save(self, data: bytes) -> str:
+        key = uuid4().hex
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return f"{self.prefix}:{key}"
+
+    def load(self, ref: str) -> bytes:
+        return self._path(_key(ref)).read_bytes()
+
+    def delete(self, refs: list[str]) -> None:
+        paths = [self._path(_key(ref)) for ref in refs]
+
+        def _delete() -> None:
+            for path in paths:
+                path.unlink(missing_ok=True)
+
+        # the files can't be restored on the rollback
+        transaction.on_commit(_delete)
+
+    def _path(self, key: str) -> Path:
+        if not key.isalnum():
+            raise ValueError(f"the payload key {key!r} is invalid")
+        return self.location / key[:2] / key
+
+
+def get_storage() -> PayloadStorage | None:
+    """Returns the storage of BARN_PAYLOAD_STORAGE for the new payloads"""
+    path = Conf.PAYLOAD_STORAGE
+    if not path:
+        return None
+    return _storage(path)
+
+
+def get_storage_for(ref: str) -> PayloadStorage:
+    prefix = ref.partition(":")[0]
+    storage = get_storage()
+    if storage is not None and storage.prefix == prefix:
+        return storage
+    for cls in (DatabaseStorage, FileSystemStorage):
+        if cls.prefix == prefix:
+            return _storage(f"{cls.__module__}.{cls.__qualname__}")
+    raise ValueError(f"the payload storage for {ref!r} is unknown")
+
+
+def delete_refs(refs: list[str]) -> None:
+    by_storage: dict[str, list[str]] = {}
+    for ref in refs:
+        by_storage.setdefault(ref.partition(":")[0], []).append(ref)
+    for items in by_storage.values():
+        get_storage_for(items[0]).delete(items)
+
+
+def delete_tasks(queryset: QuerySet) -> int:
+    """Deletes the tasks with their out-of-row payloads (by delete_task_payload), returns the number of tasks"""
+    model = queryset.model
+    if any(field.name == "payload_ref" for field in model._meta.concrete_fields):
+        # post_delete disables the fast delete, don't load the whole rows
+        queryset = queryset.only("pk", "payload_ref")
+    deleted, rows = queryset.delete()
+    return rows.get(model._meta.label, 0)
+
+
+def delete_task_payload(sender, instance, **kwargs) -> None:
+    """The post_delete receiver of Task, so any delete (the admin, QuerySet.delete()) removes the payload"""
+    # a deferred field can't be loaded from the deleted row
+    ref = instance.__dict__.get("payload_ref")
+    if ref:
+        delete_refs([ref])
+
+
+@lru_cache(maxsize=None)
+def _storage(path: str) -> PayloadStorage:
+    return import_string(path)()
+
+
+def _key(ref: str) -> str:
+    return ref.partition(":")[2]
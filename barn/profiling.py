@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+
+from django.utils.module_loading import import_string
+
+from .conf import Conf
+
+
+class StatsSink:
+    """Receives the durations of the worker and scheduler phases, e.g. "worker.claim" """
+
+    def record(self, phase: str, seconds: float) -> None:
+        raise NotImplementedError
+
+
+class PercentileSink(StatsSink):
+    def __init__(self, max_samples: int = 10000) -> None:
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self._samples: dict[str, deque[float]] = {}
+        self._counts: dict[str, int] = {}
+
+    def record(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(phase)
+            if samples is None:
+                samples = self._samples[phase] = deque(maxlen=self._max_samples)
+            samples.append(seconds)
+            self._counts[phase] = self._counts.get(phase, 0) + 1
+
+    def report(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            snapshot = {phase: sorted(samples) for phase, samples in self._samples.items()}
+            counts = dict(self._counts)
+        result = {}
+        for phase, samples in sorted(snapshot.items()):
+            if not samples:
+                continue
+            result[phase] = {
+                "count": counts[phase],
+                "mean": sum(samples) / len(samples),
+                "p50": _percentile(samples, 50),
+                "p95": _percentile(samples, 95),
+                "p99": _percentile(samples, 99),
+                "max": samples[-1],
+            }
+        return result
+
+    def format(self) -> str:
+        lines = [f"{'phase':<32} {'count':>8} {'mean,ms':>9} {'p50,ms':>9} {'p95,ms':>9} {'p99,ms':>9} {'max,ms':>9}"]
+        for phase, stats in self.report().items():
+            lines.append(
+                f"{phase:<32} {stats['count']:>8} {stats['mean'] * 1000:>9.3f} {stats['p50'] * 1000:>9.3f} "
+                f"{stats['p95'] * 1000:>9.3f} {stats['p99'] * 1000:>9.3f} {stats['max'] * 1000:>9.3f}"
+            )
+        return "\n".join(lines)
+
+
+def _percentile(samples: list[float], percent: float) -> float:
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+class Phases:
+    """Measures consecutive phases: every mark records the time since the previous one"""
+
+    __slots__ = ("_sink", "_prefix", "_last")
+
+    def __init__(self, sink: StatsSink, prefix: str) -> None:
+        self._sink = sink
+        self._prefix = prefix
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self._sink.record(f"{self._prefix}.{phase}", now - self._last)
+        self._last = now
+
+
+class _NullPhases:
+    __slots__ = ()
+
+    def mark(self, phase: str) -> None:
+        pass
+
+
+NULL_PHASES = _NullPhases()
+
+_sink: StatsSink | None = None
+_sink_loaded = False
+
+
+def get_stats_sink() -> StatsSink | None:
+    global _sink, _sink_loaded
+    if not _sink_loaded:
+        path = Conf.STATS_SINK
+        _sink = import_string(path)() if path else None
+        _sink_loaded = True
+    return _sink
+
+
+def set_stats_sink(sink: StatsSink | None) -> None:
+    global _sink, _sink_loaded
+    _sink = sink
+    _sink_loaded = True
+
+
+def start_phases(sink: StatsSink | None, prefix: str) -> Phases | _NullPhases:
+    return Phases(sink, prefix) if sink else NULL_PHASES
@@ -0,0 +1,99 @@
+import logging
+import select
+import time
+from typing import TypeVar
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+
+from .conf import Conf
+from .models import AbstractTask, TaskStatus
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=AbstractTask)
+
+
+def wait(task: T, timeout: float | None = None, interval: float = 0.05, max_interval: float = 1.0) -> T:
+    """
+    Waits until the task is done or failed and returns it reloaded, raises TimeoutError.
+    On Postgres with BARN_RESULT_NOTIFY it sleeps on LISTEN of the completion channel, otherwise
+    the status is polled with an exponential backoff from interval to max_interval.
+    """
+    model = type(task)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    listener = _Listener(model) if _can_listen(model) else None
+    if listener:
+        # the notification is only a wakeup, the rare polling covers a lost one
+        interval = max_interval = 5.0
+    try:
+        while True:
+            # the listener is started before the first check, so the completion can't be missed
+            status = model.objects.filter(pk=task.pk).values_list("status", flat=True).first()
+            if status is None:
+                raise model.DoesNotExist(f"the task {task.pk} does not exist")
+            if status != TaskStatus.QUEUED:
+                task.refresh_from_db()
+                return task
+            delay = interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"the task {task.pk} is not finished in {timeout}s")
+                delay = min(delay, remaining)
+            if listener:
+                listener.wait(task.pk, delay)
+            else:
+                time.sleep(delay)
+            interval = min(interval * 2, max_interval)
+    finally:
+        if listener:
+            listener.close()
+
+
+async def await_(task: T, timeout: float | None = None, interval: float = 0.05, max_interval: float = 1.0) -> T:
+    return await sync_to_async(_wait_in_thread, thread_sensitive=False)(task, timeout, interval, max_interval)
+
+
+def _wait_in_thread(task: T, timeout: float | None, interval: float, max_interval: float) -> T:
+    try:
+        return wait(task, timeout, interval, max_interval)
+    finally:
+        # the connections of the executor threads aren't closed by the request cycle
+        connections.close_all()
+
+
+def notify_finished(task: AbstractTask) -> None:
+    """Sends the pk of the task to the completion channel, the worker calls it after the commit"""
+    model = type(task)
+    connection = connections[router.db_for_write(model)]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [_channel(model), str(task.pk)])
+
+
+def _can_listen(model) -> bool:
+    return Conf.RESULT_NOTIFY and connections[router.db_for_read(model)].vendor == "postgresql"
+
+
+def _channel(model) -> str:
+    return Conf.RESULT_CHANNEL % {"app_label": model._meta.app_label, "model_name": model._meta.model_name}
+
+
+class _Listener:
+    def __init__(self, model) -> None:
+        import psycopg
+
+        params = connections[Conf.LISTEN_DATABASE or router.db_for_read(model)].get_connection_params()
+        params.pop("cursor_factory", None)
+        params.pop("context", None)
+        self._con = psycopg.connect(**params, autocommit=True)
+        self._con.execute(f"LISTEN {_channel(model)}")
+
+    def wait(self, pk, timeout: float) -> bool:
+        readable, _, _ = select.select([self._con.fileno()], [], [], timeout)
+        if not readable:
+            return False
+        return any(event.payload == str(pk) for event in self._con.notifies(timeout=0))
+
+    def close(self) -> None:
+        self._con.close()
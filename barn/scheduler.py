@@ -1,37 +1,64 @@
+import heapq
 import logging
 import threading
+import time
 from datetime import datetime, timedelta
 from random import random
-from typing import Type
+from typing import Any, Type
 
 from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 
 from .conf import Conf
-from .models import AbstractSchedule, Schedule
+from .cron import next_fire_time, next_fire_times
+from .db import ConnectionKeeper
+from .leader import LeaderElection, ShardMembership
+from .models import AbstractSchedule, MisfirePolicy, Schedule
+from .profiling import NULL_PHASES, get_stats_sink, start_phases
 from .signals import post_schedule_execute, pre_schedule_execute, remote_post_save
 
 log = logging.getLogger(__name__)
 
 
-def croniter(expr, dt):
-    try:
-        from croniter import croniter
-    except ImportError:
-        raise ValueError("croniter is not installed")
-    else:
-        return croniter(expr, dt)
-
-
 class Scheduler:
     def __init__(
         self,
         model: Type[AbstractSchedule] | None = None,
+        timer: bool | None = None,
+        leader_election: bool | None = None,
+        sharding: bool | None = None,
     ) -> None:
         self._model = model or Schedule
         self._interval: float = Conf.SCHEDULE_POLL_INTERVAL.total_seconds()
         self._ttl: timedelta | None = Conf.SCHEDULE_FINISHED_TTL
+        self._batch_size: int = Conf.SCHEDULE_BATCH_SIZE
+        self._max_catch_up: int | None = Conf.SCHEDULE_MAX_CATCH_UP
+        self._misfire_grace_time: timedelta = Conf.SCHEDULE_MISFIRE_GRACE_TIME
+        self._spread: timedelta | None = Conf.SCHEDULE_SPREAD
+        self._sink = get_stats_sink()
+        self._phases = NULL_PHASES
+        self._db = ConnectionKeeper()
+
+        # the timer mode: a heap of (next_run_at, pk) instead of polling
+        self._timer = Conf.SCHEDULE_TIMER if timer is None else timer
+        self._resync_interval: float = Conf.SCHEDULE_RESYNC_INTERVAL.total_seconds()
+        self._heap: list[tuple[datetime, Any]] = []
+        self._timers: dict[Any, datetime] = {}
+        self._changed_lock = threading.Lock()
+        self._changed: set[Any] = set()
+        self._resync_requested = False
+
+        self._election: LeaderElection | None = None
+        if Conf.SCHEDULE_LEADER_ELECTION if leader_election is None else leader_election:
+            self._election = LeaderElection(f"scheduler:{self._model._meta.label_lower}",
+                                            on_change=self._on_leader_change)
+        self._membership: ShardMembership | None = None
+        if Conf.SCHEDULE_SHARDING if sharding is None else sharding:
+            if self._election:
+                raise ValueError("the leader election and the sharding cannot be used together")
+            self._membership = ShardMembership(f"scheduler:{self._model._meta.label_lower}",
+                                               on_change=self._on_shard_change)
 
         self._stop_event = threading.Event()
         self._wakeup_event = threading.Event()
@@ -47,6 +74,10 @@ class Scheduler:
         self._thread = threading.Thread(target=self.run, name="scheduler")
         self._thread.start()
         remote_post_save.connect(self._on_remote_post_save)
+        if self._election:
+            self._election.start()
+        if self._membership:
+            self._membership.start()
 
     def stop(self) -> None:
         remote_post_save.disconnect(self._on_remote_post_save)
@@ -54,17 +85,58 @@ class Scheduler:
             self._stop_event.set()
             self._wakeup_event.set()
             self._thread.join(5)
+        if self._election:
+            self._election.stop()
+        if self._membership:
+            self._membership.stop()
 
     def wakeup(self) -> None:
         self._wakeup_event.set()
 
     def is_alive(self) -> bool:
+        if self._election and not self._election.is_alive():
+            return False
+        if self._membership and not self._membership.is_alive():
+            return False
         return bool(self._thread and self._thread.is_alive())
 
+    def is_active(self) -> bool:
+        if self._election:
+            return self._election.is_leader
+        if self._membership:
+            return self._membership.shard_range is not None
+        return True
+
+    def _on_leader_change(self, is_leader: bool) -> None:
+        self._wakeup_event.set()
+
+    def _on_shard_change(self, shard_range: tuple[int, int] | None) -> None:
+        with self._changed_lock:
+            self._resync_requested = True
+        self._wakeup_event.set()
+
+    def _shard_q(self) -> Q:
+        if not self._membership:
+            return Q()
+        shard_range = self._membership.shard_range
+        if shard_range is None:
+            return Q(pk__in=[])
+        return Q(shard__gte=shard_range[0], shard__lt=shard_range[1])
+
     def _on_remote_post_save(self, sender, **kwargs):
         log.debug("somwhere something was saved: %s", kwargs)
         model = kwargs["model"]
         if self._model == model or issubclass(self._model, model):
+            if not self._timer and kwargs.get("due") is False:
+                log.debug("the schedule %s is not due", kwargs.get("pk"))
+                return
+            if self._timer:
+                with self._changed_lock:
+                    pk = kwargs.get("pk")
+                    if pk is None:
+                        self._resync_requested = True
+                    else:
+                        self._changed.add(pk)
             self._wakeup_event.set()
 
     def run(self) -> None:
@@ -75,67 +147,251 @@ class Scheduler:
             log.fatal("failed")
             raise
         finally:
+            self._db.close()
             log.info("finished")
 
     def _run(self) -> None:
         while not self._stop_event.is_set():
-            self._process()
+            if not self.is_active():
+                log.debug("standby")
+                self._db.release()
+                self._sleep()
+            elif self._timer:
+                self._run_timer()
+            else:
+                self._run_poll()
+
+    def _run_poll(self) -> None:
+        while not self._stop_event.is_set() and self.is_active():
+            self._db.check()
+            processed = self._process()
             if self._ttl:
                 self._delete_old()
+            self._db.release(busy=processed > 0)
             self._sleep()
 
-    def _sleep(self) -> None:
-        jitter = self._interval / 10
-        timeout = self._interval + (jitter * random() - jitter / 2)
+    def _run_timer(self) -> None:
+        resync_at = 0.0
+        while not self._stop_event.is_set() and self.is_active():
+            self._db.check()
+            processed = 0
+            with self._changed_lock:
+                changed, self._changed = self._changed, set()
+                resync, self._resync_requested = self._resync_requested, False
+            if resync or time.monotonic() >= resync_at:
+                self._resync()
+                if self._ttl:
+                    self._delete_old()
+                resync_at = time.monotonic() + self._resync_interval
+            elif changed:
+                self._refresh(changed)
+
+            now = timezone.now()
+            head = self._head()
+            if head and head[0] <= now:
+                processed = self._process()
+                self._postpone_due(timezone.now())
+
+            timeout = resync_at - time.monotonic()
+            head = self._head()
+            if head:
+                timeout = min(timeout, (head[0] - timezone.now()).total_seconds())
+            self._db.release(busy=processed > 0)
+            self._sleep(max(timeout, 0))
+
+    def _resync(self) -> None:
+        now = timezone.now()
+        self._timers = {
+            pk: next_run_at or now
+            for pk, next_run_at in self._model.objects.filter(self._shard_q(), is_active=True)
+            .values_list("pk", "next_run_at").iterator(chunk_size=10000)
+        }
+        self._heap = [(next_run_at, pk) for pk, next_run_at in self._timers.items()]
+        heapq.heapify(self._heap)
+        log.info("loaded %d schedules", len(self._heap))
+
+    def _refresh(self, pks: set[Any]) -> None:
+        now = timezone.now()
+        found = self._model.objects.filter(self._shard_q(), pk__in=pks).values_list(
+            "pk", "next_run_at", "is_active"
+        )
+        for pk, next_run_at, is_active in found:
+            self._track(pk, (next_run_at or now) if is_active else None)
+            pks.discard(pk)
+        for pk in pks:
+            self._track(pk, None)
+        log.debug("refreshed %d schedules", len(found))
+
+    def _track(self, pk: Any, next_run_at: datetime | None) -> None:
+        if next_run_at is None:
+            self._timers.pop(pk, None)
+        elif self._timers.get(pk) != next_run_at:
+            self._timers[pk] = next_run_at
+            heapq.heappush(self._heap, (next_run_at, pk))
+
+    def _head(self) -> tuple[datetime, Any] | None:
+        # the heap entries are invalidated lazily
+        while self._heap:
+            next_run_at, pk = self._heap[0]
+            if self._timers.get(pk) == next_run_at:
+                return self._heap[0]
+            heapq.heappop(self._heap)
+        return None
+
+    def _postpone_due(self, now: datetime) -> None:
+        # the due schedules that are still there are locked by someone else or failed, check them later
+        due = set()
+        while (head := self._head()) and head[0] <= now:
+            heapq.heappop(self._heap)
+            due.add(head[1])
+            self._timers.pop(head[1])
+        if due:
+            self._refresh(due)
+            for pk in due:
+                if pk in self._timers and self._timers[pk] <= now:
+                    self._track(pk, now + timedelta(seconds=1))
+
+    def _sleep(self, timeout: float | None = None) -> None:
+        if timeout is None:
+            jitter = self._interval / 10
+            timeout = self._interval + (jitter * random() - jitter / 2)
         log.debug("sleep for %.2fs", timeout)
         self._wakeup_event.wait(timeout)
         self._wakeup_event.clear()
 
-    @transaction.atomic
-    def _process(self) -> None:
-        schedule_qs = self._model.objects.filter(
-            Q(next_run_at__isnull=True) | Q(next_run_at__lt=timezone.now()),
-            is_active=True,
-        ).order_by("next_run_at", "id")
+    def _process(self) -> int:
         cnt = 0
-        for schedule in schedule_qs.select_for_update(skip_locked=True):
-            while True:
-                cnt += 1
-                self._process_one(schedule)
-                if schedule.is_active and schedule.next_run_at and schedule.next_run_at < timezone.now():
-                    continue
+        while not self._stop_event.is_set():
+            self._phases = start_phases(self._sink, "scheduler")
+            with transaction.atomic():
+                processed, fetched = self._process_chunk()
+            if fetched:
+                self._phases.mark("commit")
+            self._phases = NULL_PHASES
+            cnt += processed
+            if fetched < self._batch_size:
                 break
         if cnt == 0:
             log.debug("no pending schedules")
         else:
             log.info("processed %d schedules", cnt)
+        return cnt
 
-    def _process_one(self, schedule: AbstractSchedule) -> None:
-        log.info("found a schedule %s", schedule.pk)
+    def _process_chunk(self) -> tuple[int, int]:
+        schedule_qs = self._model.objects.filter(
+            Q(next_run_at__isnull=True) | Q(next_run_at__lt=timezone.now()),
+            self._shard_q(),
+            is_active=True,
+        ).order_by("next_run_at", "id")
+        schedules = list(schedule_qs.select_for_update(skip_locked=True)[:self._batch_size])
+        self._phases.mark("claim")
+
+        now = timezone.now()
+        pending = []
+        for schedule in schedules:
+            if (
+                schedule.misfire_policy == MisfirePolicy.SKIP
+                and schedule.next_run_at
+                and schedule.next_run_at < now - self._misfire_grace_time
+            ):
+                self._skip_missed(schedule, now)
+            else:
+                pending.append(schedule)
+
+        cnt = 0
+        runs = 0
+        while pending:
+            cnt += len(pending)
+            runs += 1
+            self._process_many(pending)
+            now = timezone.now()
+            pending = [schedule for schedule in pending if self._is_behind(schedule, now)]
+            for schedule in pending:
+                max_catch_up = schedule.max_catch_up or self._max_catch_up
+                if schedule.misfire_policy == MisfirePolicy.COALESCE or (max_catch_up and runs >= max_catch_up):
+                    self._skip_missed(schedule, now)
+            pending = [schedule for schedule in pending if self._is_behind(schedule, now)]
 
-        pre_schedule_execute.send(sender=self, schedule=schedule)
-        schedule.process()
+        if schedules:
+            self._model.objects.bulk_update(schedules, self._update_fields())
+            self._phases.mark("save")
+            if self._timer:
+                for schedule in schedules:
+                    self._track(schedule.pk, schedule.next_run_at if schedule.is_active else None)
+        return cnt, len(schedules)
+
+    def _process_many(self, schedules: list[AbstractSchedule]) -> None:
+        for schedule in schedules:
+            log.info("found a schedule %s", schedule.pk)
+            pre_schedule_execute.send(sender=self, schedule=schedule)
+        self._phases.mark("pre_execute")
+
+        self._model.process_many(schedules)
+        self._phases.mark("process")
 
         now = timezone.now()
-        schedule.last_run_at = now
+        fire_times = self._next_fire_times(schedules, now)
+        for schedule in schedules:
+            schedule.last_run_at = now
+            self._move_next(schedule, schedule.next_run_at or now, now, fire_times.get(schedule.pk))
+            post_schedule_execute.send(sender=self, schedule=schedule)
+        self._phases.mark("post_execute")
+
+    def _update_fields(self) -> list[str]:
+        fields = self._model.process_update_fields
+        if fields is None:
+            return [field.name for field in self._model._meta.concrete_fields if not field.primary_key]
+        return list(dict.fromkeys(("is_active", "next_run_at", "last_run_at", *fields)))
+
+    def _is_behind(self, schedule: AbstractSchedule, now: datetime) -> bool:
+        return bool(schedule.is_active and schedule.next_run_at and schedule.next_run_at < now)
+
+    def _skip_missed(self, schedule: AbstractSchedule, now: datetime) -> None:
+        # jump straight to the first run after now
+        log.info("the schedule %s missed runs since %s are skipped", schedule.pk, schedule.next_run_at)
+        self._move_next(schedule, now, now)
+
+    def _next_fire_times(self, schedules: list[AbstractSchedule], now: datetime) -> dict[Any, datetime]:
+        # the cron schedules of a batch usually share a few expressions and moments
+        keys, items = [], []
+        for schedule in schedules:
+            if schedule.cron and not schedule.interval:
+                offset = schedule.spread_offset(schedule.spread or self._spread)
+                keys.append((schedule.pk, offset))
+                items.append((schedule.cron, (schedule.next_run_at or now) - offset))
+        try:
+            times = next_fire_times(items)
+        except (TypeError, ValueError):
+            # an invalid cron is found and deactivated one by one
+            return {}
+        return {pk: fire_times[0] + offset for (pk, offset), fire_times in zip(keys, times)}
+
+    def _move_next(
+        self,
+        schedule: AbstractSchedule,
+        moment: datetime,
+        now: datetime,
+        next_run_at: datetime | None = None,
+    ) -> None:
         if schedule.interval:
             schedule.next_run_at = now + schedule.interval
             log.info("the schedule %s is scheduled to %s", schedule.pk, schedule.next_run_at)
+        elif schedule.cron and next_run_at:
+            schedule.next_run_at = next_run_at
+            log.info("the schedule %s is scheduled to %s", schedule.pk, schedule.next_run_at)
         elif schedule.cron:
+            # the offset is removed before and added after to get the same cron occurrence
+            offset = schedule.spread_offset(schedule.spread or self._spread)
             try:
-                iter = croniter(schedule.cron, schedule.next_run_at or now)
+                schedule.next_run_at = next_fire_time(schedule.cron, moment - offset) + offset
             except (TypeError, ValueError):
                 log.error("the scheduler %s has an invalid cron", schedule.pk, exc_info=True)
                 schedule.is_active = False
             else:
-                schedule.next_run_at = iter.get_next(datetime)
                 log.info("the schedule %s is scheduled to %s", schedule.pk, schedule.next_run_at)
         else:
             schedule.is_active = False
 
-        post_schedule_execute.send(sender=self, schedule=schedule)
-        schedule.save()
-
     @transaction.atomic
     def _delete_old(self) -> None:
         moment = timezone.now() - self._ttl
@@ -0,0 +1,122 @@
+import json
+import zlib
+from functools import lru_cache
+from typing import Any
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .conf import Conf
+
+# the header of the stored payload: the format of the serializer and the compression
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+
+class Serializer:
+    """Encodes the task args and result, format is stored with the data and must be unique"""
+
+    format: int
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+
+class JsonSerializer(Serializer):
+    format = 1
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class MsgpackSerializer(Serializer):
+    format = 2
+
+    def __init__(self) -> None:
+        try:
+            import msgpack
+        except ImportError:
+            raise ImproperlyConfigured("the msgpack package is required by MsgpackSerializer")
+        self._msgpack = msgpack
+
+    def dumps(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return self._msgpack.unpackb(data, raw=False)
+
+
+class PayloadCodec:
+    def __init__(self, serializer: Serializer, compression: str | None = None, threshold: int = 1024) -> None:
+        if compression not in (None, "zlib", "zstd"):
+            raise ImproperlyConfigured(f"the compression {compression!r} is unknown")
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+
+    def dumps(self, value: Any) -> bytes:
+        data = self.serializer.dumps(value)
+        compression = COMPRESSION_NONE
+        if self.compression and len(data) >= self.threshold:
+            if self.compression == "zstd":
+                data, compression = _zstd().ZstdCompressor().compress(data), COMPRESSION_ZSTD
+            else:
+                data, compression = zlib.compress(data), COMPRESSION_ZLIB
+        return bytes((self.serializer.format, compression)) + data
+
+    def loads(self, data: bytes | memoryview) -> Any:
+        data = bytes(data)
+        serializer_format, compression, body = data[0], data[1], data[2:]
+        if compression == COMPRESSION_ZLIB:
+            body = zlib.decompress(body)
+        elif compression == COMPRESSION_ZSTD:
+            body = _zstd().ZstdDecompressor().decompress(body)
+        if serializer_format == self.serializer.format:
+            return self.serializer.loads(body)
+        return _serializer_by_format(serializer_format).loads(body)
+
+
+def get_codec() -> PayloadCodec | None:
+    """Returns the codec of BARN_TASK_SERIALIZER, None means the JSON columns"""
+    path = Conf.TASK_SERIALIZER
+    if not path:
+        return None
+    return _codec(path, Conf.TASK_COMPRESSION, Conf.TASK_COMPRESSION_THRESHOLD)
+
+
+def dumps(value: Any) -> bytes:
+    codec = get_codec() or _codec("barn.serializers.JsonSerializer", None, 0)
+    return codec.dumps(value)
+
+
+def loads(data: bytes | memoryview) -> Any:
+    # the data written with another serializer is still readable
+    codec = get_codec() or _codec("barn.serializers.JsonSerializer", None, 0)
+    return codec.loads(data)
+
+
+@lru_cache(maxsize=None)
+def _codec(path: str, compression: str | None, threshold: int) -> PayloadCodec:
+    return PayloadCodec(import_string(path)(), compression, threshold)
+
+
+def _serializer_by_format(serializer_format: int) -> Serializer:
+    for cls in (JsonSerializer, MsgpackSerializer):
+        if cls.format == serializer_format:
+            return cls()
+    raise ValueError(f"the serializer format {serializer_format} is unknown")
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured("the zstandard package is required by the zstd compression")
+    return zstandard
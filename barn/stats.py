@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from typing import Type
+
+from django.db import connections, router
+from django.db.models import Count, QuerySet
+from django.utils import timezone
+
+from .conf import Conf
+from .models import AbstractTask, Task, TaskStatus
+
+_cache_lock = threading.Lock()
+_cache: dict[tuple[str, bool], tuple[float, dict]] = {}
+
+
+def queue_stats(model: Type[AbstractTask] | None = None, exact: bool = False, ttl: float | None = None) -> dict:
+    """
+    Returns the depth of the queue:
+
+        {
+            "model": "barn.task",
+            "status": {"Q": 10, "D": 1000000, "F": 12},
+            "func": {"app.tasks.send_email": 10},
+            "queued": 10,
+            "due": 3,
+            "oldest_run_at": datetime(...),
+            "lag": 1.5,
+            "estimated": True,
+            "sampled_at": datetime(...),
+        }
+
+    The queued tasks are counted exactly with the partial index barn_task_find_next_idx, the finished
+    ones are estimated from the planner statistics on Postgres unless exact is set. The result is cached
+    in the process for ttl seconds (BARN_STATS_CACHE_TTL).
+    """
+    model = model or Task
+    ttl = Conf.STATS_CACHE_TTL if ttl is None else ttl
+    key = (model._meta.label_lower, exact)
+    now = time.monotonic()
+    if ttl > 0:
+        with _cache_lock:
+            cached = _cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    stats = _collect(model, exact)
+
+    if ttl > 0:
+        with _cache_lock:
+            _cache[key] = (now + ttl, stats)
+    return stats
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def _collect(model: Type[AbstractTask], exact: bool) -> dict:
+    now = timezone.now()
+    queued_qs = model.objects.filter(status=TaskStatus.QUEUED)
+
+    # all of these are answered from the partial index on run_at of the queued tasks
+    queued = queued_qs.count()
+    due = queued_qs.filter(run_at__lte=now).count()
+    oldest_run_at = queued_qs.order_by("run_at").values_list("run_at", flat=True).first()
+
+    by_func = None
+    if _has_field(model, "func"):
+        by_func = dict(queued_qs.values_list("func").annotate(count=Count("pk")).order_by())
+
+    finished = None if exact else _estimate_finished(model)
+    estimated = finished is not None
+    if finished is None:
+        finished = dict(
+            model.objects.filter(status__in=[TaskStatus.DONE, TaskStatus.FAILED])
+            .values_list("status")
+            .annotate(count=Count("pk"))
+            .order_by()
+        )
+
+    by_status = {status: 0 for status in TaskStatus.values}
+    by_status.update(finished)
+    by_status[TaskStatus.QUEUED] = queued
+
+    return {
+        "model": model._meta.label_lower,
+        "status": by_status,
+        "func": by_func,
+        "queued": queued,
+        "due": due,
+        "oldest_run_at": oldest_run_at,
+        "lag": max((now - oldest_run_at).total_seconds(), 0) if oldest_run_at else 0,
+        "estimated": estimated,
+        "sampled_at": now,
+    }
+
+
+def estimate_count(queryset: QuerySet, threshold: int = 10000) -> tuple[int, bool]:
+    """
+    Returns the planner estimate of the number of rows on Postgres when it is above the threshold,
+    otherwise the exact count. The second value tells if the count is estimated.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        sql, params = queryset.order_by().values("pk").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        rows = int(plan[0]["Plan"]["Plan Rows"])
+        if rows > threshold:
+            return rows, True
+    return queryset.count(), False
+
+
+def _has_field(model: Type[AbstractTask], name: str) -> bool:
+    return any(field.name == name for field in model._meta.get_fields())
+
+
+def _estimate_finished(model: Type[AbstractTask]) -> dict[str, int] | None:
+    """
+    Estimates the number of the finished tasks from pg_class.reltuples and the most common values
+    of the status column in pg_stats, both are maintained by autovacuum/ANALYZE.
+    """
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor != "postgresql":
+        return None
+
+    table = model._meta.db_table
+    status_column = model._meta.get_field("status").column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+            [connection.ops.quote_name(table)],
+        )
+        row = cursor.fetchone()
+        if not row or row[0] is None or row[0] < 0:
+            # never vacuumed or analyzed
+            return None
+        total = row[0]
+        cursor.execute(
+            "SELECT most_common_vals::text::text[], most_common_freqs FROM pg_stats "
+            "WHERE schemaname = current_schema() AND tablename = %s AND attname = %s",
+            [table, status_column],
+        )
+        row = cursor.fetchone()
+    if not row or not row[0]:
+        return None
+
+    frequencies = dict(zip(row[0], row[1]))
+    return {
+        status: int(total * frequencies.get(status, 0))
+        for status in (TaskStatus.DONE, TaskStatus.FAILED)
+    }
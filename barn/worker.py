@@ -1,18 +1,26 @@
 import logging
 import threading
 import traceback
+from collections import deque
 from datetime import timedelta
 from random import random
-from typing import Type
+from typing import TYPE_CHECKING, Any, Sequence, Type
 
 import asgiref.local
-from django.db import transaction
+from django.db import connections, router, transaction
 from django.utils import timezone
 
 from .conf import Conf
-from .models import AbstractTask, Task, TaskStatus
+from .db import ConnectionKeeper
+from .models import AbstractTask, Task, TaskGroup, TaskStatus
+from .payloads import delete_tasks
+from .profiling import NULL_PHASES, get_stats_sink, start_phases
+from .result import notify_finished
 from .signals import post_task_execute, pre_task_execute, remote_post_save
 
+if TYPE_CHECKING:
+    from .dispatcher import WakeupDispatcher
+
 log = logging.getLogger(__name__)
 
 _current_task = asgiref.local.Local()
@@ -23,101 +31,216 @@ def get_current_taskt() -> AbstractTask | None:
 
 
 class Worker:
+    """
+    Processes the queued tasks of one or several models. With several models, the tables with due
+    tasks are found by one combined query and the tasks are claimed from them in turn.
+    """
+
     def __init__(
         self,
-        model: Type[AbstractTask] | None = None,
+        model: Type[AbstractTask] | Sequence[Type[AbstractTask]] | None = None,
         name: str | None = None,
+        dispatcher: "WakeupDispatcher | None" = None,
     ) -> None:
-        self._model = model or Task
+        if isinstance(model, Sequence):
+            if not model:
+                raise ValueError("the models is not provided")
+            self._models: list[Type[AbstractTask]] = list(model)
+        else:
+            self._models = [model or Task]
+        self._model = self._models[0]
+        self._turn = 0
         self._interval: float = Conf.TASL_POLL_INTERVAL.total_seconds()
         self._ttl: timedelta | None = Conf.TASK_FINISHED_TTL
         self._name = name or "worker"
+        self._dispatcher = dispatcher
+        self._hints: deque[tuple[Type[AbstractTask] | None, Any]] = deque(maxlen=100)
+        self._sink = get_stats_sink()
+        self._phases = NULL_PHASES
+        self._notify_finished = {
+            model
+            for model in self._models
+            if Conf.RESULT_NOTIFY and connections[router.db_for_write(model)].vendor == "postgresql"
+        }
+        self._db = ConnectionKeeper()
 
         self._stop_event = threading.Event()
         self._wakeup_event = threading.Event()
         self._thread: threading.Thread | None = None
+        self._idle = False
 
     @property
     def name(self) -> str:
         return self._name
 
+    def is_idle(self) -> bool:
+        return self._idle
+
     def start(self) -> None:
         self._stop_event.clear()
         self._wakeup_event.clear()
         self._thread = threading.Thread(target=self.run, name=self._name)
         self._thread.start()
-        remote_post_save.connect(self._on_remote_post_save)
+        if self._dispatcher:
+            self._dispatcher.register(self)
+        else:
+            remote_post_save.connect(self._on_remote_post_save)
 
     def stop(self) -> None:
-        remote_post_save.disconnect(self._on_remote_post_save)
+        if self._dispatcher:
+            self._dispatcher.unregister(self)
+        else:
+            remote_post_save.disconnect(self._on_remote_post_save)
         if self._thread and not self._stop_event.is_set():
             self._stop_event.set()
             self._wakeup_event.set()
             self._thread.join(5)
 
-    def wakeup(self) -> None:
+    def wakeup(self, pk: Any = None, model: Type[AbstractTask] | None = None) -> None:
+        if pk is not None:
+            self._hints.append((model, pk))
         self._wakeup_event.set()
 
     def is_alive(self) -> bool:
         return bool(self._thread and self._thread.is_alive())
 
+    def accepts(self, model) -> bool:
+        return any(m == model or issubclass(m, model) for m in self._models)
+
     def _on_remote_post_save(self, sender, **kwargs):
         log.debug("somwhere something was saved: %s", kwargs)
-        model = kwargs["model"]
-        if self._model == model or issubclass(self._model, model):
+        if self.accepts(kwargs["model"]):
             self._wakeup_event.set()
 
     def run(self) -> None:
-        log.info("stated with the model %s", self._model)
+        log.info("stated with the models %s", self._models)
         try:
             self._run()
         except:
             log.fatal("failed")
             raise
         finally:
+            self._db.close()
             log.info("finished")
 
     def _run(self) -> None:
         while not self._stop_event.is_set():
-            self._process()
+            processed = self._process()
             if self._ttl:
                 self._delete_old()
+            self._db.release(busy=processed > 0)
             self._sleep()
 
     def _sleep(self) -> None:
         jitter = self._interval / 10
         timeout = self._interval + (jitter * random() - jitter / 2)
         log.debug("sleep for %.2fs", timeout)
-        self._wakeup_event.wait(timeout)
-        self._wakeup_event.clear()
+        if self._dispatcher:
+            self._dispatcher.idle(self)
+        self._idle = True
+        try:
+            self._wakeup_event.wait(timeout)
+            self._wakeup_event.clear()
+        finally:
+            self._idle = False
+            if self._dispatcher:
+                self._dispatcher.busy(self)
 
-    def _process(self) -> None:
+    def _process(self) -> int:
         cnt = 0
         while not self._stop_event.is_set():
-            processed = self._process_next()
-            if not processed:
+            # the probe is the first query after the sleep, the connection could be dead by now
+            self._db.check()
+            due = self._probe()
+            processed = 0
+            while due and not self._stop_event.is_set():
+                # between the tasks, the connection could be lost while the previous one was running
+                self._db.check()
+                model = due.pop(0)
+                if self._process_next(model):
+                    processed += 1
+                    # one task per model in turn, so a busy table doesn't starve the others
+                    due.append(model)
+            cnt += processed
+            if not processed or len(self._models) == 1:
                 break
-            cnt += 1
         if cnt == 0:
             log.debug("no pending tasks")
         else:
             log.info("processed %d tasks", cnt)
+        return cnt
 
-    @transaction.atomic
-    def _process_next(self) -> bool:
-        task_qs = self._model.objects.filter(
+    def _probe(self) -> list[Type[AbstractTask]]:
+        """Returns the models with due tasks, the first one changes every time"""
+        models = self._models[self._turn:] + self._models[:self._turn]
+        self._turn = (self._turn + 1) % len(self._models)
+        if len(models) == 1:
+            return models
+
+        now = timezone.now()
+        by_alias: dict[str, list[Type[AbstractTask]]] = {}
+        for model in models:
+            by_alias.setdefault(router.db_for_read(model), []).append(model)
+        due = set()
+        for alias, alias_models in by_alias.items():
+            # SELECT 0 WHERE EXISTS (...) UNION ALL SELECT 1 WHERE EXISTS (...), one round trip
+            # answered from the partial indexes on run_at of the queued tasks
+            parts, params = [], []
+            for i, model in enumerate(alias_models):
+                task_qs = self._due_qs(model, now).values("pk")
+                sql, qs_params = task_qs.query.get_compiler(using=alias).as_sql()
+                parts.append(f"SELECT {i} WHERE EXISTS ({sql})")
+                params.extend(qs_params)
+            with connections[alias].cursor() as cursor:
+                cursor.execute(" UNION ALL ".join(parts), params)
+                due.update(alias_models[row[0]] for row in cursor.fetchall())
+        return [model for model in models if model in due]
+
+    def _due_qs(self, model: Type[AbstractTask], now):
+        return model.objects.filter(
             status=TaskStatus.QUEUED,
-            run_at__lt=timezone.now(),
-        ).order_by("run_at")
-        task = task_qs.select_for_update(skip_locked=True).first()
+            run_at__lt=now,
+        )
+
+    def _process_next(self, model: Type[AbstractTask] | None = None) -> bool:
+        self._phases = start_phases(self._sink, "worker")
+        with transaction.atomic(using=router.db_for_write(model or self._model)):
+            processed = self._claim_and_process(model or self._model)
+        if processed:
+            self._phases.mark("commit")
+        self._phases = NULL_PHASES
+        return processed
+
+    def _claim_and_process(self, model: Type[AbstractTask]) -> bool:
+        task_qs = self._due_qs(model, timezone.now())
+        task = None
+        hint = self._pop_hint(model)
+        if hint is not None:
+            # the dispatcher has woken us up for this task, try to claim it directly
+            task = task_qs.filter(pk=hint).select_for_update(skip_locked=True).first()
+        if not task:
+            task = task_qs.order_by("run_at").select_for_update(skip_locked=True).first()
         if not task:
             return False
+        self._phases.mark("claim")
         self._process_one(task)
         return True
 
+    def _pop_hint(self, model: Type[AbstractTask] | None = None) -> Any:
+        # the hints of the other models are put back, popleft and append are thread-safe
+        for _ in range(len(self._hints)):
+            try:
+                hint_model, pk = self._hints.popleft()
+            except IndexError:
+                return None
+            if model is None or hint_model is None or issubclass(model, hint_model):
+                return pk
+            self._hints.append((hint_model, pk))
+        return None
+
     @transaction.atomic
     def sync_call_task(self, task: AbstractTask) -> None:
-        task = self._model.objects.select_for_update().get(pk=task.pk)
+        task = type(task).objects.select_for_update().get(pk=task.pk)
         if task.status != TaskStatus.QUEUED:
             raise ValueError("The task already processed. Is worker running?")
         self._process_one(task)
@@ -126,44 +249,83 @@ class Worker:
         _current_task.value = task
         log.info("process the task %s task", task)
 
+        phases = self._phases
         task.started_at = timezone.now()
         try:
             pre_task_execute.send(sender=self, task=task)
+            phases.mark("pre_execute")
 
             task.process()
+            phases.mark("process")
 
             task.status = TaskStatus.DONE
             task.error = None
             task.finished_at = timezone.now()
 
             post_task_execute.send(sender=self, task=task, exc=None)
+            phases.mark("post_execute")
             task.save()
+            phases.mark("save")
             log.info("the task %s is processed with success in %s",
                      task.pk, task.finished_at - task.started_at)
 
         except Exception as exc:
+            phases.mark("process")
             task.status = TaskStatus.FAILED
             task.error = "\n".join(traceback.format_exception(exc))
             task.finished_at = timezone.now()
 
             post_task_execute.send(sender=self, task=task, exc=exc)
+            phases.mark("post_execute")
             task.save()
+            phases.mark("save")
             log.info("the task %s is processed with error in %s",
                      task.pk, task.finished_at - task.started_at, exc_info=True)
 
         finally:
             del _current_task.value
 
-    @transaction.atomic
+        self._on_finished(task)
+        phases.mark("on_finished")
+
+    def _on_finished(self, task: AbstractTask) -> None:
+        # the next step of a chain and the counter of a group are updated in the same transaction,
+        # a broken continuation fails the task instead of the worker
+        using = router.db_for_write(type(task))
+        try:
+            with transaction.atomic(using=using):
+                task.on_finished()
+        except Exception as exc:
+            log.error("the continuation of the task %s failed", task.pk, exc_info=True)
+            task.status = TaskStatus.FAILED
+            task.error = "\n".join(traceback.format_exception(exc))
+            try:
+                with transaction.atomic(using=using):
+                    task.save(update_fields=["status", "error"])
+                    # the failed member is still counted by its group
+                    task.on_finished()
+            except Exception:
+                log.error("cannot fail the task %s", task.pk, exc_info=True)
+        if type(task) in self._notify_finished:
+            # a notify failure cannot roll back the finished task
+            transaction.on_commit(lambda: notify_finished(task), using=using, robust=True)
+
     def _delete_old(self) -> None:
+        for model in self._models:
+            self._delete_old_of(model)
+
+    def _delete_old_of(self, model: Type[AbstractTask]) -> None:
         moment = timezone.now() - self._ttl
-        task_qs = self._model.objects.filter(
-            status__in=[TaskStatus.DONE, TaskStatus.FAILED],
-            run_at__lt=moment,
-        )
-        deleted, _ = task_qs.delete()
+        with transaction.atomic(using=router.db_for_write(model)):
+            task_qs = model.objects.filter(
+                status__in=[TaskStatus.DONE, TaskStatus.FAILED],
+                run_at__lt=moment,
+            )
+            deleted = delete_tasks(task_qs)
+            if issubclass(model, Task):
+                TaskGroup.objects.filter(finished_at__lt=moment).delete()
         log.log(
             logging.DEBUG if deleted == 0 else logging.INFO,
-            "deleted %d finished tasks older than %s",
-            deleted, moment
+            "deleted %d finished %s tasks older than %s",
+            deleted, model._meta.label_lower, moment
         )
@@ -0,0 +1,144 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bus import get_bus_class
+from .conf import Conf
+from .decorators import apply_async, call_on_commit, func_path, make_task
+from .models import Task, TaskGroup, TaskStatus
+
+log = logging.getLogger(__name__)
+
+
+def signature(func, **args) -> dict:
+    """The JSON description of a task call which can be stored in the chain or the chord"""
+    return {"func": func_path(func), "args": args or None}
+
+
+def chain(
+    *signatures: dict,
+    countdown: timedelta | int | float | None = None,
+    eta: datetime | None = None,
+) -> Task:
+    """Queues the first task, every next one is queued by the worker when the previous one is done"""
+    if not signatures:
+        raise ValueError("the chain is empty")
+    first, *rest = signatures
+    return apply_async(
+        first["func"],
+        args=first.get("args"),
+        countdown=countdown,
+        eta=eta,
+        chain=rest or None,
+    )
+
+
+def group(
+    signatures: Iterable[dict | list[dict]],
+    countdown: timedelta | int | float | None = None,
+    eta: datetime | None = None,
+) -> TaskGroup:
+    """Queues the tasks with one INSERT, a list of signatures in the group is a chain"""
+    return _apply_group(list(signatures), None, countdown, eta)
+
+
+def chord(
+    signatures: Iterable[dict | list[dict]],
+    callback: dict,
+    countdown: timedelta | int | float | None = None,
+    eta: datetime | None = None,
+) -> TaskGroup:
+    """Queues the group, the callback is queued when all the tasks of the group are done"""
+    return _apply_group(list(signatures), callback, countdown, eta)
+
+
+def _apply_group(
+    signatures: list[dict | list[dict]],
+    callback: dict | None,
+    countdown: timedelta | int | float | None,
+    eta: datetime | None,
+) -> TaskGroup:
+    if Conf.TASK_SYNC and (countdown or eta):
+        raise RuntimeError("A task cannot be executed in eager mode")
+
+    members = []
+    for item in signatures:
+        if isinstance(item, dict):
+            item = [item]
+        first, *rest = item
+        members.append((first, rest or None))
+
+    with transaction.atomic():
+        task_group = TaskGroup.objects.create(pending=len(members), callback=callback)
+        tasks = Task.objects.bulk_create([
+            make_task(
+                first["func"],
+                args=first.get("args"),
+                countdown=countdown,
+                eta=eta,
+                group=task_group,
+                chain=rest,
+            )
+            for first, rest in members
+        ])
+        log.info("the group %s of %d tasks is queued", task_group.pk, len(tasks))
+        if not tasks:
+            _finish_group(task_group.pk)
+        if Conf.TASK_SYNC:
+            for task in tasks:
+                call_on_commit(task)
+    get_bus_class().notify(Task)
+    return task_group
+
+
+def on_task_finished(task: Task) -> None:
+    """Called by the worker in the transaction of the finished task"""
+    if task.status == TaskStatus.DONE and task.chain:
+        # the chain continues as the same member of the group
+        first, *rest = task.chain
+        next_task = apply_async(
+            first["func"],
+            args=first.get("args"),
+            chain=rest or None,
+            group_id=task.group_id,
+        )
+        log.info("the task %s continues the chain of the task %s", next_task.pk, task.pk)
+        return
+
+    if task.group_id:
+        _count_finished(task.group_id, 1, 1 if task.status == TaskStatus.FAILED else 0)
+
+
+def on_tasks_cancelled(group_ids: Iterable) -> None:
+    """Counts the deleted queued members as failed, called in the transaction of the delete"""
+    for group_id, count in Counter(group_id for group_id in group_ids if group_id).items():
+        _count_finished(group_id, count, count)
+
+
+def _count_finished(group_id, finished: int, failed: int) -> None:
+    TaskGroup.objects.filter(pk=group_id).update(
+        pending=F("pending") - finished,
+        failed=F("failed") + failed,
+    )
+    # the row is locked by the update until the commit, only one member sees zero
+    pending = TaskGroup.objects.filter(pk=group_id).values_list("pending", flat=True).first()
+    if pending == 0:
+        _finish_group(group_id)
+
+
+def _finish_group(group_id) -> None:
+    TaskGroup.objects.filter(pk=group_id).update(finished_at=timezone.now())
+    task_group = TaskGroup.objects.get(pk=group_id)
+    if not task_group.callback:
+        log.info("the group %s is finished", group_id)
+    elif task_group.failed:
+        log.warning("the group %s is finished with %d failed tasks, the callback is skipped",
+                    group_id, task_group.failed)
+    else:
+        callback = apply_async(task_group.callback["func"], args=task_group.callback.get("args"))
+        log.info("the group %s is finished, the callback %s is queued", group_id, callback.pk)
@@ -0,0 +1,251 @@
+"""
+Benchmarks of the task queue, the results are written as JSON to compare them between commits.
+
+    python -m benchmarks.run --db sqlite --output sqlite.json
+    PGHOST=localhost PGUSER=postgres python -m benchmarks.run --db postgres --output pg.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from typing import Callable
+
+import django
+
+
+def _timed(func: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def _clean() -> None:
+    from barn.models import Schedule, Task
+    Task.objects.all().delete()
+    Schedule.objects.all().delete()
+
+
+def _bulk_tasks(count: int, **kwargs) -> None:
+    from django.utils import timezone
+
+    from barn.models import Task
+    now = timezone.now()
+    kwargs.setdefault("run_at", now - timedelta(seconds=1))
+    Task.objects.bulk_create(
+        [Task(func="benchmarks.run.noop", args={"i": i}, **kwargs) for i in range(count)],
+        batch_size=1000,
+    )
+
+
+def noop(**kwargs) -> None:
+    pass
+
+
+def bench_apply_async(count: int) -> dict:
+    from django.db import transaction
+
+    from barn.decorators import apply_async
+    _clean()
+
+    def _run():
+        for i in range(count):
+            with transaction.atomic():
+                apply_async(noop, args={"i": i})
+
+    duration = _timed(_run)
+    return {"count": count, "seconds": duration, "rps": count / duration}
+
+
+def bench_claim(count: int, workers: list[int]) -> dict:
+    from django.db import connections
+
+    from barn.models import Task
+    from barn.worker import Worker
+    result = {}
+    for worker_count in workers:
+        _clean()
+        _bulk_tasks(count)
+        errors = []
+
+        def _work(worker: Worker) -> None:
+            try:
+                worker._process()
+            except Exception as exc:
+                errors.append(repr(exc))
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=_work, args=(Worker(Task, name=f"worker-{i}"),))
+            for i in range(worker_count)
+        ]
+
+        def _run():
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        duration = _timed(_run)
+        result[str(worker_count)] = {
+            "count": count,
+            "seconds": duration,
+            "rps": count / duration,
+            "errors": len(errors),
+        }
+    return result
+
+
+def bench_latency(count: int, workers: int, with_bus: bool) -> dict:
+    from django.test.utils import override_settings
+
+    from barn.bench import percentiles
+    from barn.bus import get_bus_class
+    from barn.decorators import apply_async
+    from barn.dispatcher import WakeupDispatcher
+    from barn.models import Task, TaskStatus
+    from barn.worker import Worker
+    _clean()
+
+    with override_settings(BARN_BUS_ENABLED=with_bus):
+        bus_class = get_bus_class()
+        bus = None
+        if with_bus:
+            bus_class.connect(Task)
+            bus = bus_class(Task)
+            bus.start()
+        dispatcher = WakeupDispatcher()
+        dispatcher.connect()
+        pool = [Worker(Task, name=f"worker-{i}", dispatcher=dispatcher) for i in range(workers)]
+        for worker in pool:
+            worker.start()
+        try:
+            time.sleep(1)
+            for i in range(count):
+                apply_async(noop, args={"i": i})
+                time.sleep(0.02)
+            deadline = time.monotonic() + 60
+            while Task.objects.filter(status=TaskStatus.QUEUED).exists() and time.monotonic() < deadline:
+                time.sleep(0.1)
+        finally:
+            for worker in pool:
+                worker.stop()
+            dispatcher.disconnect()
+            if bus:
+                bus.stop()
+                bus_class.disconnect(Task)
+
+    latencies = [
+        (started_at - run_at).total_seconds()
+        for run_at, started_at in Task.objects.filter(started_at__isnull=False).values_list("run_at", "started_at")
+    ]
+    return {
+        "count": count,
+        "processed": len(latencies),
+        "workers": workers,
+        "bus": with_bus,
+        "latency": percentiles(latencies),
+    }
+
+
+def bench_scheduler(count: int) -> dict:
+    from barn.models import Schedule, Task
+    from barn.scheduler import Scheduler
+    _clean()
+    Schedule.objects.bulk_create(
+        [Schedule(name=f"s{i}", func="benchmarks.run.noop", interval=timedelta(hours=1)) for i in range(count)],
+        batch_size=1000,
+    )
+    duration = _timed(Scheduler()._process)
+    return {
+        "count": count,
+        "tasks": Task.objects.count(),
+        "seconds": duration,
+        "rps": count / duration,
+    }
+
+
+def bench_cleanup(count: int) -> dict:
+    from django.utils import timezone
+
+    from barn.models import TaskStatus
+    from barn.worker import Worker
+    _clean()
+    _bulk_tasks(count, status=TaskStatus.DONE, run_at=timezone.now() - timedelta(days=60))
+    _bulk_tasks(count)
+    worker = Worker()
+    worker._ttl = timedelta(days=30)
+    duration = _timed(worker._delete_old)
+    return {"count": count, "seconds": duration, "rps": count / duration}
+
+
+def _meta(db: str) -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "db": db,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "platform": platform.platform(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--output", default=None, help="the JSON file, stdout by default")
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--schedules", type=int, default=2000)
+    parser.add_argument("--latency-tasks", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--only", nargs="+", default=None,
+                        choices=["apply_async", "claim", "latency", "scheduler", "cleanup"])
+    args = parser.parse_args(argv)
+
+    os.environ["BARN_BENCH_DB"] = args.db
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    django.setup()
+
+    from django.test.utils import setup_databases, teardown_databases
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        benchmarks = {
+            "apply_async": lambda: bench_apply_async(args.tasks),
+            "claim": lambda: bench_claim(args.tasks, args.workers),
+            "latency": lambda: {
+                "poll": bench_latency(args.latency_tasks, max(args.workers), with_bus=False),
+                "bus": bench_latency(args.latency_tasks, max(args.workers), with_bus=True),
+            },
+            "scheduler": lambda: bench_scheduler(args.schedules),
+            "cleanup": lambda: bench_cleanup(args.tasks),
+        }
+        results = {}
+        for name, bench in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"running {name}...", file=sys.stderr)
+            results[name] = bench()
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    report = {"meta": _meta(args.db), "results": results}
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+from pathlib import Path
+
+SECRET_KEY = "barn-benchmarks"
+DEBUG = False
+USE_TZ = True
+TIME_ZONE = "UTC"
+DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "barn",
+]
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "root": {"level": os.environ.get("BARN_BENCH_LOG_LEVEL", "WARNING")},
+}
+
+if os.environ.get("BARN_BENCH_DB", "sqlite") == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("PGDATABASE", "barn-bench"),
+            "USER": os.environ.get("PGUSER", "postgres"),
+            "PASSWORD": os.environ.get("PGPASSWORD", ""),
+            "HOST": os.environ.get("PGHOST", "localhost"),
+            "PORT": os.environ.get("PGPORT", "5432"),
+            "TIME_ZONE": "UTC",
+        }
+    }
+    BARN_BUS_BACKEND = "barn.bus.PgBus"
+else:
+    _path = str(Path(tempfile.gettempdir()) / "barn-bench.sqlite3")
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": _path,
+            "TIME_ZONE": "UTC",
+            # the deferred transactions fail with "database is locked" on a lock upgrade
+            "OPTIONS": {"timeout": 60, "transaction_mode": "IMMEDIATE", "init_command": "PRAGMA journal_mode=WAL;"},
+            "TEST": {"NAME": _path},
+        }
+    }
+    BARN_BUS_BACKEND = "barn.bus.UnixSocketBus"
+
+BARN_BUS_ENABLED = False
+BARN_TASL_POLL_INTERVAL = 1
+BARN_SCHEDULE_POLL_INTERVAL = 1
@@ -6,3 +6,10 @@ import pytest
 #     engine = create_engine('sqlite:///:memory:')
 #     metadata.create_all(engine)
 #     yield engine
+
+
+@pytest.fixture(autouse=True)
+def _clear_stats_cache():
+    from barn.stats import clear_cache
+
+    clear_cache()
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:13
+
+import barn.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stall", "0004_someschedule_misfire_policy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="someschedule",
+            name="shard",
+            field=models.PositiveSmallIntegerField(
+                default=barn.models.random_shard, editable=False
+            ),
+        ),
+    ]
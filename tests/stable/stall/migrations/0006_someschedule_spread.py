@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stall", "0005_someschedule_shard"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="someschedule",
+            name="spread",
+            field=models.DurationField(
+                blank=True,
+                help_text="The cron runs are shifted by a stable offset within this window",
+                null=True,
+            ),
+        ),
+    ]
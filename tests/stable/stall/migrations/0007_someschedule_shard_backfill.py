@@ -0,0 +1,14 @@
+from barn.migration_utils import backfill_shards
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stall", "0006_someschedule_spread"),
+    ]
+
+    operations = [
+        # 0005 gave all the existing schedules the same shard
+        backfill_shards("stall", "someschedule"),
+    ]
@@ -0,0 +1,99 @@
+import time
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from barn.admin import EstimatedCountPaginator, TaskAdmin
+from barn.models import Task, TaskStatus
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTaskAdmin:
+    def test_changelist(self, admin_client):
+        Task.objects.create(func="func", args={"a": 1}, status=TaskStatus.FAILED, error="error")
+
+        response = admin_client.get(reverse("admin:barn_task_changelist"))
+
+        assert response.status_code == 200
+        cl = response.context["cl"]
+        assert cl.keyset_ordering == ("-pk",)
+        assert cl.result_list[0].get_deferred_fields() == {"args", "args_data", "result", "result_data", "error"}
+
+    def test_keyset(self, admin_client, settings):
+        now = timezone.now()
+        Task.objects.bulk_create(
+            [Task(func="func", run_at=now - timedelta(minutes=i), status=TaskStatus.DONE) for i in range(250)]
+        )
+        url = reverse("admin:barn_task_changelist")
+
+        response = admin_client.get(url, {"status__exact": TaskStatus.DONE})
+        cl = response.context["cl"]
+        assert cl.keyset_ordering == ("-run_at", "-pk")
+        first = list(cl.result_list)
+        assert len(first) == 100
+        assert first[0].run_at == now
+        assert "before=" in cl.keyset_next_url
+
+        response = admin_client.get(url + cl.keyset_next_url)
+        cl = response.context["cl"]
+        second = list(cl.result_list)
+        assert second[0].run_at == first[-1].run_at - timedelta(minutes=1)
+        assert cl.keyset_next_url
+
+        response = admin_client.get(url + cl.keyset_next_url)
+        cl = response.context["cl"]
+        assert len(list(cl.result_list)) == 50
+        assert cl.keyset_next_url is None
+
+    def test_invalid_keyset(self, admin_client):
+        url = reverse("admin:barn_task_changelist")
+        response = admin_client.get(url, {"status__exact": TaskStatus.DONE, "before": "nonsense"})
+        assert response.status_code == 302
+
+    def test_run_at_filter(self, admin_client):
+        Task.objects.create(func="func")
+        Task.objects.create(func="func", run_at=timezone.now() - timedelta(days=30))
+
+        response = admin_client.get(reverse("admin:barn_task_changelist"), {
+            "run_at__gte": (timezone.now() - timedelta(days=7)).isoformat(),
+        })
+
+        assert response.status_code == 200
+        assert len(list(response.context["cl"].result_list)) == 1
+
+    def test_paginator(self):
+        Task.objects.create(func="func")
+        paginator = EstimatedCountPaginator(Task.objects.order_by("pk"), 10)
+        assert paginator.count == 1
+        assert not paginator.estimated
+
+    def test_requeue_action(self, admin_client):
+        task = Task.objects.create(func="func", status=TaskStatus.FAILED)
+
+        response = admin_client.post(reverse("admin:barn_task_changelist"), {
+            "action": "requeue_tasks",
+            "_selected_action": [task.pk],
+        }, follow=True)
+
+        assert [str(m) for m in response.context["messages"]] == ["1 tasks are requeued"]
+        task.refresh_from_db()
+        assert task.status == TaskStatus.QUEUED
+
+    def test_cancel_action_in_background(self, admin_client, monkeypatch):
+        monkeypatch.setattr(TaskAdmin, "bulk_background_threshold", 1)
+        tasks = Task.objects.bulk_create([Task(func="func", run_at=timezone.now()) for _ in range(3)])
+
+        response = admin_client.post(reverse("admin:barn_task_changelist"), {
+            "action": "cancel_tasks",
+            "_selected_action": [task.pk for task in tasks],
+        }, follow=True)
+
+        assert [str(m) for m in response.context["messages"]] == [
+            "3 selected tasks are being cancelled in the background"
+        ]
+        deadline = time.monotonic() + 5
+        while Task.objects.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not Task.objects.exists()
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from barn.autoscale import Autoscaler
+
+
+def make_autoscaler(min_workers: int = 1, max_workers: int = 8) -> Autoscaler:
+    autoscaler = Autoscaler(
+        min_workers,
+        max_workers,
+        lag=timedelta(seconds=5),
+        up_interval=timedelta(seconds=10),
+        down_interval=timedelta(seconds=60),
+    )
+    # a round clock, the large monotonic values make the intervals inexact
+    autoscaler._changed_at = 0.0
+    return autoscaler
+
+
+class TestAutoscaler:
+    def test_scale_up(self):
+        autoscaler = make_autoscaler()
+        now = autoscaler._changed_at
+        assert autoscaler.decide(2, 0, 10.0, now + 1) == 0
+        assert autoscaler.decide(2, 0, 10.0, now + 10) == 1
+        assert autoscaler.decide(3, 0, 10.0, now + 15) == 0
+        assert autoscaler.decide(3, 0, 10.0, now + 20) == 2
+        assert autoscaler.decide(5, 0, 10.0, now + 30) == 3
+        assert autoscaler.decide(8, 0, 10.0, now + 40) == 0
+
+    def test_no_scale_up_with_idle_workers(self):
+        autoscaler = make_autoscaler()
+        now = autoscaler._changed_at
+        assert autoscaler.decide(2, 1, 10.0, now + 100) == 0
+
+    def test_scale_down(self):
+        autoscaler = make_autoscaler()
+        now = autoscaler._changed_at
+        assert autoscaler.decide(4, 2, 0.0, now + 1) == 0
+        assert autoscaler.decide(4, 2, 0.0, now + 30) == 0
+        assert autoscaler.decide(4, 2, 0.0, now + 61) == -1
+        # the next one waits for the whole interval again
+        assert autoscaler.decide(3, 1, 0.0, now + 62) == 0
+        assert autoscaler.decide(3, 1, 0.0, now + 100) == 0
+        assert autoscaler.decide(3, 1, 0.0, now + 122) == -1
+
+    def test_scale_down_is_reset_by_load(self):
+        autoscaler = make_autoscaler()
+        now = autoscaler._changed_at
+        assert autoscaler.decide(4, 2, 0.0, now + 1) == 0
+        assert autoscaler.decide(4, 0, 0.0, now + 30) == 0
+        assert autoscaler.decide(4, 2, 0.0, now + 31) == 0
+        assert autoscaler.decide(4, 2, 0.0, now + 62) == 0
+        assert autoscaler.decide(4, 2, 0.0, now + 91) == -1
+
+    def test_bounds(self):
+        autoscaler = make_autoscaler(min_workers=2, max_workers=4)
+        now = autoscaler._changed_at
+        assert autoscaler.decide(1, 1, 0.0, now) == 1
+        assert autoscaler.decide(6, 0, 10.0, now) == -2
+        assert autoscaler.decide(2, 2, 0.0, now + 1000) == 0
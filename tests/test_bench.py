@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from barn.bench import percentiles
+from barn.management.commands import barnbench
+from barn.models import Task, TaskStatus
+from barn.worker import Worker
+
+
+def test_percentiles():
+    assert percentiles([]) == {}
+    result = percentiles([float(i) for i in range(1, 101)])
+    assert result["p50"] == 51
+    assert result["p99"] == 99
+    assert result["max"] == 100
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBarnBench:
+    def test_run(self):
+        call_command("barnbench", rate=200, duration=0.2, wait=0, json=True, keep=True)
+        count = Task.objects.count()
+        assert count > 0
+
+        # the tasks of the run are deleted without --keep
+        call_command("barnbench", rate=200, duration=0.2, wait=0, json=True)
+        assert Task.objects.count() == count
+
+    def test_report(self, capsys):
+        call_command("barnbench", rate=100, duration=0.1, mix="noop=1,fail=1", wait=0, json=True, keep=True)
+        Worker()._process()
+        command = barnbench.Command()
+        run = json.loads(capsys.readouterr().out)["run"]
+        report = command._report(run, Task.objects.earliest("run_at").run_at, Task.objects.count())
+        assert report["processed"] == Task.objects.count()
+        assert report["failed"] == Task.objects.filter(status=TaskStatus.FAILED).count()
+        assert set(report["latency"]) == {"p50", "p95", "p99", "max"}
+
+    def test_invalid_mix(self):
+        with pytest.raises(CommandError):
+            call_command("barnbench", mix="unknown=1")
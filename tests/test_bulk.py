@@ -0,0 +1,42 @@
+import pytest
+from django.utils import timezone
+
+from barn.bulk import cancel_tasks, clone_tasks, iter_pk_chunks, requeue_tasks
+from barn.models import Task, TaskStatus
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBulk:
+    def test_iter_pk_chunks(self):
+        pks = [task.pk for task in Task.objects.bulk_create([Task(func="func", run_at=timezone.now()) for _ in range(5)])]
+        assert list(iter_pk_chunks(Task.objects.all(), 2)) == [pks[:2], pks[2:4], pks[4:]]
+
+    def test_requeue_tasks(self):
+        failed = Task.objects.create(func="func", status=TaskStatus.FAILED, error="error")
+        done = Task.objects.create(func="func", status=TaskStatus.DONE)
+
+        assert requeue_tasks(Task.objects.all(), 1) == 1
+
+        failed.refresh_from_db()
+        assert failed.status == TaskStatus.QUEUED
+        assert failed.error is None
+        done.refresh_from_db()
+        assert done.status == TaskStatus.DONE
+
+    def test_clone_tasks(self):
+        Task.objects.create(func="func", args={"a": 1}, status=TaskStatus.FAILED, error="error")
+        Task.objects.create(func="func", status=TaskStatus.DONE)
+
+        assert clone_tasks(Task.objects.all(), 1) == 1
+
+        clone = Task.objects.get(status=TaskStatus.QUEUED)
+        assert clone.func == "func"
+        assert clone.args == {"a": 1}
+        assert clone.error is None
+
+    def test_cancel_tasks(self):
+        Task.objects.bulk_create([Task(func="func", run_at=timezone.now()) for _ in range(3)])
+        Task.objects.create(func="func", status=TaskStatus.DONE)
+
+        assert cancel_tasks(Task.objects.all(), 2) == 3
+        assert list(Task.objects.values_list("status", flat=True)) == [TaskStatus.DONE]
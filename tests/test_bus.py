@@ -0,0 +1,74 @@
+import json
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+
+from barn.bus import BaseBus, UnixSocketBus
+from barn.models import Schedule, Task
+from barn.scheduler import Scheduler
+from barn.signals import remote_post_save
+
+
+class TestUnixSocketBus:
+    def test_roundtrip(self, settings, tmp_path):
+        settings.BARN_BUS_SOCKET_DIR = str(tmp_path)
+
+        events = []
+        received = threading.Event()
+
+        def _on_remote_post_save(sender, **kwargs):
+            events.append((kwargs["model"], kwargs["pk"], kwargs["event"]))
+            if kwargs["pk"] is not None:
+                received.set()
+
+        remote_post_save.connect(_on_remote_post_save)
+        bus = UnixSocketBus(Task)
+        bus.start()
+        try:
+            for _ in range(50):
+                if list(tmp_path.glob("*.sock")):
+                    break
+                received.wait(0.1)
+            UnixSocketBus._broadcast(b'{"model": "barn.schedule", "pk": 1, "event": "create"}')
+            UnixSocketBus._broadcast(b'{"model": "barn.task", "pk": 2, "event": "create"}')
+            assert received.wait(5)
+        finally:
+            bus.stop()
+            remote_post_save.disconnect(_on_remote_post_save)
+
+        assert (Task, None, "reconnect") in events
+        assert (Task, 2, "create") in events
+        assert all(model is not Schedule for model, _, _ in events)
+        assert not list(tmp_path.glob("*.sock"))
+
+
+class TestScheduleEvents:
+    def test_future_schedule(self, mocker):
+        publish = mocker.patch.object(BaseBus, "_publish")
+        schedule = Schedule(pk=1, func="func", next_run_at=timezone.now() + timedelta(hours=1))
+
+        # published whatever BARN_SCHEDULE_TIMER of the producer is
+        BaseBus._on_schedule_post_save(Schedule, schedule, created=False)
+        payload = publish.call_args.args[2]
+        assert json.loads(payload)["due"] is False
+
+        events = []
+
+        def _on_remote_post_save(sender, **kwargs):
+            events.append(kwargs)
+
+        remote_post_save.connect(_on_remote_post_save)
+        try:
+            BaseBus(Schedule)._dispatch(payload)
+        finally:
+            remote_post_save.disconnect(_on_remote_post_save)
+        assert events[0]["due"] is False
+
+        timer = Scheduler(timer=True)
+        poll = Scheduler(timer=False)
+        for scheduler in (timer, poll):
+            scheduler._on_remote_post_save(None, **events[0])
+        assert timer._wakeup_event.is_set()
+        assert timer._changed == {1}
+        assert not poll._wakeup_event.is_set()
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from barn.cron import CronExpr, compile_cron, next_fire_times
+
+
+def dt(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class TestCron:
+    @pytest.mark.parametrize("expr, moment, expected", [
+        ("* * * * *", dt(2024, 1, 1, 10, 0, 30), dt(2024, 1, 1, 10, 1)),
+        ("*/15 * * * *", dt(2024, 1, 1, 10, 0), dt(2024, 1, 1, 10, 15)),
+        ("0 0 * * *", dt(2024, 12, 31, 23, 59), dt(2025, 1, 1)),
+        ("0 0 29 feb *", dt(2024, 3, 1), dt(2028, 2, 29)),
+        ("0 0 L * *", dt(2024, 2, 10), dt(2024, 2, 29)),
+        ("15 10 * * mon-fri", dt(2024, 7, 19, 11), dt(2024, 7, 22, 10, 15)),
+        ("0 0 13 * 5", dt(2024, 7, 1), dt(2024, 7, 5)),
+        ("0 0 * * 7", dt(2024, 7, 1), dt(2024, 7, 7)),
+        ("* * * * * */10", dt(2024, 1, 1, 10, 0, 5), dt(2024, 1, 1, 10, 0, 10)),
+        ("@hourly", dt(2024, 1, 1, 10, 30), dt(2024, 1, 1, 11)),
+        # both day columns are restricted by the text, a day matches any of them
+        ("0 0 1-3 * 0-6", dt(2024, 7, 10), dt(2024, 7, 11)),
+        # a column starting with "*" is a star, both of them have to match
+        ("0 0 */2 * 1", dt(2024, 7, 1), dt(2024, 7, 15)),
+        ("0 0 * * */4", dt(2024, 7, 1), dt(2024, 7, 4)),
+        ("0 0 * * 5#3", dt(2024, 7, 1), dt(2024, 7, 19)),
+        ("30 2 * * sun#1", dt(2024, 7, 8), dt(2024, 8, 4, 2, 30)),
+        ("0 0 * * L5", dt(2024, 7, 1), dt(2024, 7, 26)),
+        ("0 0 * * 5L", dt(2024, 7, 27), dt(2024, 8, 30)),
+        ("0 0 15W * *", dt(2024, 6, 1), dt(2024, 6, 14)),
+        ("0 0 1W * *", dt(2024, 5, 31), dt(2024, 6, 3)),
+        ("0 0 LW * *", dt(2024, 8, 1), dt(2024, 8, 30)),
+        # "1/2" ends on Saturday, not on Sunday as 7
+        ("0 0 * * 1/2", dt(2024, 7, 5), dt(2024, 7, 8)),
+    ])
+    def test_next(self, expr, moment, expected):
+        assert CronExpr(expr).next(moment) == expected
+
+    @pytest.mark.parametrize("weekday, expected", [
+        ("1/2", {1, 3, 5}),
+        ("5/1", {5, 6}),
+        ("3/4", {3}),
+        ("*/2", {0, 2, 4, 6}),
+        ("1-7/3", {0, 1, 4}),
+    ])
+    def test_weekday_step(self, weekday, expected):
+        mask = CronExpr(f"0 0 * * {weekday}").weekdays
+        assert {i for i in range(8) if mask & (1 << i)} == expected
+
+    @pytest.mark.parametrize("expr", [
+        "", "* * * *", "60 * * * *", "* * 0 * *", "*/0 * * * *", "a * * * *", "* * * * 5#6", "* * 32W * *",
+    ])
+    def test_invalid(self, expr):
+        with pytest.raises(ValueError):
+            CronExpr(expr)
+
+    def test_never(self):
+        with pytest.raises(ValueError):
+            CronExpr("0 0 30 2 *").next(dt(2024, 1, 1))
+
+    def test_compile_cron_cached(self):
+        assert compile_cron("0 * * * *") is compile_cron("0 * * * *")
+
+    def test_next_fire_times(self):
+        moment = dt(2024, 1, 1)
+        assert next_fire_times([("0 * * * *", moment), ("@daily", moment)], count=2) == [
+            [dt(2024, 1, 1, 1), dt(2024, 1, 1, 2)],
+            [dt(2024, 1, 2), dt(2024, 1, 3)],
+        ]
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+import pytest
+
+from barn.db import ConnectionKeeper
+
+
+class FakeConnection:
+    def __init__(self, usable: bool = True) -> None:
+        self.alias = "default"
+        self.connection = object()
+        self.in_atomic_block = False
+        self.errors_occurred = False
+        self.usable = usable
+        self.pings = 0
+
+    def is_usable(self) -> bool:
+        self.pings += 1
+        return self.usable
+
+    def close(self) -> None:
+        self.connection = None
+
+
+@pytest.fixture
+def conn(mocker):
+    conn = FakeConnection()
+    connections = mocker.patch("barn.db.connections")
+    connections.all.return_value = [conn]
+    return conn
+
+
+class TestConnectionKeeper:
+    def test_check_keeps_healthy(self, conn):
+        keeper = ConnectionKeeper(transaction_pooling=False)
+        keeper.check()
+        assert conn.connection is not None
+        assert conn.pings == 0
+
+    def test_check_closes_broken(self, conn):
+        keeper = ConnectionKeeper(transaction_pooling=False)
+        conn.errors_occurred = True
+        conn.usable = False
+        keeper.check()
+        assert conn.connection is None
+
+    def test_check_after_error(self, conn):
+        keeper = ConnectionKeeper(transaction_pooling=False)
+        conn.errors_occurred = True
+        keeper.check()
+        assert conn.pings == 1
+        assert conn.connection is not None
+        assert not conn.errors_occurred
+
+    def test_check_pings_unused(self, conn):
+        keeper = ConnectionKeeper(health_check_interval=timedelta(microseconds=1), transaction_pooling=False)
+        keeper.check()
+        assert conn.pings == 1
+
+    def test_check_recycles_old(self, conn):
+        keeper = ConnectionKeeper(max_age=timedelta(microseconds=1), transaction_pooling=False)
+        keeper.check()
+        keeper.check()
+        assert conn.connection is None
+
+    def test_check_skips_atomic_block(self, conn):
+        keeper = ConnectionKeeper(max_age=timedelta(microseconds=1), transaction_pooling=False)
+        conn.in_atomic_block = True
+        keeper.check()
+        keeper.check()
+        assert conn.connection is not None
+
+    def test_release_when_idle(self, conn):
+        keeper = ConnectionKeeper(idle_timeout=timedelta(hours=1), transaction_pooling=False)
+        keeper.release(busy=True)
+        assert conn.connection is not None
+
+        keeper = ConnectionKeeper(idle_timeout=timedelta(microseconds=1), transaction_pooling=False)
+        keeper.release()
+        assert conn.connection is None
+
+    def test_release_with_transaction_pooling(self, conn):
+        keeper = ConnectionKeeper(transaction_pooling=True)
+        keeper.release(busy=True)
+        assert conn.connection is None
@@ -4,7 +4,7 @@ import pytest
 from django.utils import timezone
 
 from barn.decorators import task
-from barn.models import Task
+from barn.models import Task, TaskStatus
 
 
 @task
@@ -39,11 +39,31 @@ class TestDecorator:
 
         assert Task.objects.count() == 2
 
-        assert not some_task.cancel(a=1, b=4)
+        assert some_task.cancel(a=1, b=4) == 0
         assert Task.objects.count() == 2
 
-        assert some_task.cancel(a=2, b=4)
+        assert some_task.cancel(b=4, a=2) == 1
         assert Task.objects.count() == 1
 
         task = Task.objects.get()
         assert task.args == dict(a=1, b=3)
+
+    def test_cancel_only_queued(self):
+        some_task.delay(a=1)
+        Task.objects.update(status=TaskStatus.DONE)
+        some_task.delay(a=1)
+
+        assert some_task.cancel(a=1) == 1
+        assert Task.objects.get().status == TaskStatus.DONE
+
+    def test_cancel_without_args(self):
+        some_task.apply_async()
+        some_task.delay()
+
+        assert some_task.cancel() == 2
+
+    def test_cancel_bulk_created(self):
+        Task.objects.bulk_create([Task(func="test_decorator.some_task", args={"a": 1}, run_at=timezone.now())])
+
+        assert some_task.cancel(a=1) == 1
+        assert not Task.objects.exists()
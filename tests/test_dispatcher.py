@@ -0,0 +1,42 @@
+from barn.dispatcher import WakeupDispatcher
+from barn.models import Task
+from barn.worker import Worker
+
+
+class TestWakeupDispatcher:
+    def test_dispatch_one_idle_worker(self):
+        dispatcher = WakeupDispatcher()
+        workers = [Worker(dispatcher=dispatcher) for _ in range(3)]
+        for worker in workers:
+            dispatcher.register(worker)
+            dispatcher.idle(worker)
+
+        assert dispatcher.dispatch(Task, 10) == 1
+        assert workers[0]._wakeup_event.is_set()
+        assert workers[0]._pop_hint() == 10
+        assert not workers[1]._wakeup_event.is_set()
+        assert not workers[2]._wakeup_event.is_set()
+
+        assert dispatcher.dispatch(Task, 11) == 1
+        assert workers[1]._pop_hint() == 11
+        assert not workers[2]._wakeup_event.is_set()
+
+    def test_dispatch_busy_workers(self):
+        dispatcher = WakeupDispatcher()
+        workers = [Worker(dispatcher=dispatcher) for _ in range(2)]
+        for worker in workers:
+            dispatcher.register(worker)
+
+        assert dispatcher.dispatch(Task, 10) == 1
+        assert sum(w._wakeup_event.is_set() for w in workers) == 1
+
+    def test_dispatch_without_pk(self):
+        dispatcher = WakeupDispatcher()
+        workers = [Worker(dispatcher=dispatcher) for _ in range(3)]
+        for worker in workers:
+            dispatcher.register(worker)
+            dispatcher.idle(worker)
+
+        assert dispatcher.dispatch(Task) == 3
+        assert all(w._wakeup_event.is_set() for w in workers)
+        assert all(w._pop_hint() is None for w in workers)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from barn.leader import LeaderElection, ShardMembership
+from barn.models import SCHEDULE_SHARDS, Lease
+
+
+@pytest.mark.django_db(transaction=True)
+class TestLeaderElection:
+    def test_acquire(self):
+        e1 = LeaderElection("test", ttl=timedelta(seconds=30))
+        e2 = LeaderElection("test", ttl=timedelta(seconds=30))
+
+        assert e1.acquire()
+        assert not e2.acquire()
+        assert e1.acquire()
+        assert Lease.objects.get().holder == e1.holder
+
+        e1.release()
+        assert e2.acquire()
+        assert not e1.acquire()
+
+    def test_failover(self):
+        e1 = LeaderElection("test", ttl=timedelta(seconds=30))
+        e2 = LeaderElection("test", ttl=timedelta(seconds=30))
+
+        assert e1.acquire()
+        Lease.objects.update(expires_at=None)
+        assert e2.acquire()
+        assert not e1.acquire()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestShardMembership:
+    def test_join(self):
+        m1 = ShardMembership("test", ttl=timedelta(seconds=30))
+        m2 = ShardMembership("test", ttl=timedelta(seconds=30))
+
+        assert m1.join() == (0, SCHEDULE_SHARDS)
+
+        m2.join()
+        ranges = sorted([m1.join(), m2.join()])
+        assert ranges == [(0, SCHEDULE_SHARDS // 2), (SCHEDULE_SHARDS // 2, SCHEDULE_SHARDS)]
+
+        m2.release()
+        assert m1.join() == (0, SCHEDULE_SHARDS)
+
+    def test_expired_member(self):
+        m1 = ShardMembership("test", ttl=timedelta(seconds=30))
+        m2 = ShardMembership("test", ttl=timedelta(seconds=30))
+        m1.join()
+        m2.join()
+
+        Lease.objects.filter(holder=m2.holder).update(expires_at=timezone.now() - timedelta(seconds=1))
+        assert m1.join() == (0, SCHEDULE_SHARDS)
+        assert not Lease.objects.filter(holder=m2.holder).exists()
@@ -0,0 +1,37 @@
+from urllib.request import urlopen
+
+import pytest
+
+from barn.metrics import MetricsServer, WorkerMetrics
+from barn.models import Task
+from barn.worker import Worker
+
+
+@pytest.mark.django_db(transaction=True)
+class TestMetrics:
+    def test_render(self, mocker):
+        mocker.patch.object(Task, "process")
+        Task.objects.create(func="func")
+
+        metrics = WorkerMetrics([Task], sample_interval=0)
+        metrics.connect()
+        try:
+            Worker()._process_next()
+        finally:
+            metrics.disconnect()
+
+        text = metrics.render()
+        assert 'barn_tasks_total{model="barn.task",func="func",status="done"} 1' in text
+        assert 'barn_tasks_in_flight{model="barn.task"} 0' in text
+        assert 'barn_task_duration_seconds_count{model="barn.task",func="func"} 1' in text
+        assert 'barn_queue_depth{model="barn.task"} 0' in text
+
+    def test_server(self):
+        server = MetricsServer(WorkerMetrics(), "127.0.0.1", 0)
+        server.start()
+        try:
+            port = server._server.server_address[1]
+            with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                assert b"# TYPE barn_tasks_total counter" in response.read()
+        finally:
+            server.stop()
@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+import pytest
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from barn.bulk import clone_tasks
+from barn.decorators import apply_async, cancel_async
+from barn.models import Task, TaskPayload, TaskStatus
+from barn.payloads import FileSystemStorage
+from barn.worker import Worker
+
+
+def echo(**kwargs) -> int:
+    return len(kwargs["ids"])
+
+
+@pytest.fixture
+def db_storage(settings):
+    settings.BARN_PAYLOAD_STORAGE = "barn.payloads.DatabaseStorage"
+    settings.BARN_PAYLOAD_THRESHOLD = 100
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPayloads:
+    def test_small_args(self, db_storage):
+        task = apply_async(echo, args={"ids": [1]})
+        assert task.payload_ref is None
+        assert Task.objects.values_list("args", flat=True).get() == {"ids": [1]}
+
+    def test_database_storage(self, db_storage):
+        args = {"ids": list(range(100))}
+        task = apply_async(echo, args=args)
+        assert task.args == args
+        assert task.payload_ref.startswith("db:")
+        assert Task.objects.values_list("args", flat=True).get() is None
+        assert TaskPayload.objects.count() == 1
+
+        task = Task.objects.get()
+        assert task.args is None
+        assert task.load_args() == args
+
+        Worker()._process_next()
+
+        task = Task.objects.get()
+        assert task.status == TaskStatus.DONE
+        assert task.result == 100
+        assert TaskPayload.objects.count() == 1
+
+    def test_filesystem_storage(self, settings, tmp_path):
+        settings.BARN_PAYLOAD_STORAGE = "barn.payloads.FileSystemStorage"
+        settings.BARN_PAYLOAD_DIR = str(tmp_path)
+        settings.BARN_PAYLOAD_THRESHOLD = 100
+        storage = FileSystemStorage(str(tmp_path))
+
+        task = apply_async(echo, args={"ids": list(range(100))})
+        assert task.payload_ref.startswith("file:")
+        assert storage.load(task.payload_ref)
+
+        Worker()._process_next()
+        assert Task.objects.get().result == 100
+
+    def test_cleanup(self, db_storage):
+        apply_async(echo, args={"ids": list(range(100))})
+        Task.objects.update(status=TaskStatus.DONE, run_at=timezone.now() - timedelta(days=2))
+
+        worker = Worker()
+        worker._ttl = timedelta(days=1)
+        worker._delete_old()
+
+        assert not Task.objects.exists()
+        assert not TaskPayload.objects.exists()
+
+    def test_delete(self, db_storage):
+        for _ in range(3):
+            apply_async(echo, args={"ids": list(range(100))})
+
+        Task.objects.first().delete()
+        assert TaskPayload.objects.count() == 2
+
+        Task.objects.all().delete()
+        assert not TaskPayload.objects.exists()
+
+    def test_delete_files(self, settings, tmp_path):
+        settings.BARN_PAYLOAD_STORAGE = "barn.payloads.FileSystemStorage"
+        settings.BARN_PAYLOAD_DIR = str(tmp_path)
+        settings.BARN_PAYLOAD_THRESHOLD = 100
+        apply_async(echo, args={"ids": list(range(100))})
+        assert any(path.is_file() for path in tmp_path.rglob("*"))
+
+        Task.objects.filter(pk=Task.objects.get().pk).delete()
+        assert not any(path.is_file() for path in tmp_path.rglob("*"))
+
+    def test_clone(self, db_storage):
+        args = {"ids": list(range(100))}
+        apply_async(echo, args=args)
+        Task.objects.update(status=TaskStatus.FAILED)
+
+        assert clone_tasks(Task.objects.all()) == 1
+
+        original, clone = Task.objects.order_by("pk")
+        assert clone.payload_ref != original.payload_ref
+        assert clone.load_args() == args
+        assert TaskPayload.objects.count() == 2
+
+    def test_cancel(self, db_storage):
+        apply_async(echo, args={"ids": list(range(100))})
+        assert cancel_async(echo, args={"ids": list(range(100))}) == 1
+        assert not TaskPayload.objects.exists()
+
+    def test_post_save(self, db_storage):
+        args = {"ids": list(range(100))}
+        seen = []
+
+        def _on_post_save(sender, instance: Task, **kwargs):
+            seen.append((instance.args, instance.payload_ref, instance.status))
+
+        post_save.connect(_on_post_save, sender=Task)
+        try:
+            apply_async(echo, args=args)
+            Worker()._process_next()
+        finally:
+            post_save.disconnect(_on_post_save, sender=Task)
+
+        ref = Task.objects.get().payload_ref
+        assert ref
+        assert seen == [(args, ref, TaskStatus.QUEUED), (args, ref, TaskStatus.DONE)]
+        assert Task.objects.values_list("args", flat=True).get() is None
@@ -0,0 +1,39 @@
+import pytest
+
+from barn.models import Task
+from barn.profiling import PercentileSink, set_stats_sink
+from barn.worker import Worker
+
+
+@pytest.fixture
+def sink():
+    sink = PercentileSink()
+    set_stats_sink(sink)
+    yield sink
+    set_stats_sink(None)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestProfiling:
+    def test_worker_phases(self, mocker, sink):
+        mocker.patch.object(Task, "process")
+        Task.objects.create(func="func")
+
+        worker = Worker()
+        assert worker._process_next()
+
+        report = sink.report()
+        assert list(report) == sorted(
+            f"worker.{phase}"
+            for phase in ("claim", "pre_execute", "process", "post_execute", "save", "on_finished", "commit")
+        )
+        assert all(stats["count"] == 1 for stats in report.values())
+        assert "worker.process" in sink.format()
+
+    def test_disabled(self, mocker):
+        record = mocker.patch.object(PercentileSink, "record")
+        mocker.patch.object(Task, "process")
+        Task.objects.create(func="func")
+
+        assert Worker()._process_next()
+        record.assert_not_called()
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from barn.models import Task, TaskStatus
+from barn.worker import Worker
+
+
+@pytest.mark.django_db(transaction=True)
+class TestResult:
+    def _process_later(self, delay: float) -> threading.Thread:
+        def _run():
+            time.sleep(delay)
+            Worker()._process_next()
+
+        thread = threading.Thread(target=_run)
+        thread.start()
+        return thread
+
+    def test_wait(self, mocker):
+        mocker.patch.object(Task, "process")
+        task = Task.objects.create(func="func")
+
+        thread = self._process_later(0.2)
+        try:
+            assert task.wait(timeout=5) is task
+        finally:
+            thread.join()
+        assert task.status == TaskStatus.DONE
+
+    def test_wait_timeout(self):
+        task = Task.objects.create(func="func")
+        with pytest.raises(TimeoutError):
+            task.wait(timeout=0.1)
+
+    def test_wait_deleted(self):
+        task = Task.objects.create(func="func")
+        Task.objects.all().delete()
+        with pytest.raises(Task.DoesNotExist):
+            task.wait(timeout=1)
+
+    def test_await(self, mocker):
+        mocker.patch.object(Task, "process")
+        task = Task.objects.create(func="func")
+
+        thread = self._process_later(0.2)
+        try:
+            result = asyncio.run(task.await_(timeout=5))
+        finally:
+            thread.join()
+        assert result.status == TaskStatus.DONE
+
+    def test_notify_failure(self, mocker):
+        mocker.patch.object(Task, "process")
+        notify_finished = mocker.patch("barn.worker.notify_finished", side_effect=RuntimeError("notify"))
+        task = Task.objects.create(func="func")
+
+        worker = Worker()
+        worker._notify_finished = {Task}
+        assert worker._process_next()
+
+        notify_finished.assert_called_once()
+        task.refresh_from_db()
+        assert task.status == TaskStatus.DONE
@@ -2,61 +2,211 @@ from datetime import timedelta
 import pytest
 from django.utils import timezone
 
-from barn.models import Schedule
+from barn.models import MisfirePolicy, Schedule, Task
 from barn.scheduler import Scheduler
+from tests.stable.stall.models import SomeSchedule
 
 
 @pytest.mark.django_db(transaction=True)
 class TestScheduler:
     def test__process(self, mocker):
-        _process_one = mocker.patch.object(Scheduler, "_process_one")
+        process_many = mocker.patch.object(Schedule, "process_many")
 
         scheduler = Scheduler()
         scheduler._process()
-        _process_one.assert_not_called()
+        process_many.assert_not_called()
 
         Schedule.objects.create(cron="* * * * *", is_active=False)
         scheduler._process()
-        _process_one.assert_not_called()
+        process_many.assert_not_called()
 
         Schedule.objects.create(cron="* * * * *")
         scheduler._process()
-        _process_one.assert_called_once()
+        process_many.assert_called_once()
 
-    def test__process_one_oneshot(self, mocker):
-        schedule_process = mocker.patch.object(Schedule, "process")
+    def test__process_chunks(self):
+        for i in range(5):
+            Schedule.objects.create(func="func", interval=timedelta(hours=1))
+
+        scheduler = Scheduler()
+        scheduler._batch_size = 2
+        scheduler._process()
+
+        assert Task.objects.count() == 5
+        assert not Schedule.objects.filter(next_run_at__lt=timezone.now()).exists()
+        assert not Schedule.objects.filter(last_run_at__isnull=True).exists()
+
+    def test__process_oneshot(self, mocker):
+        process_many = mocker.patch.object(Schedule, "process_many")
 
         schedule = Schedule.objects.create()
 
         scheduler = Scheduler()
-        scheduler._process_one(schedule)
-        schedule_process.assert_called_once()
+        scheduler._process()
+        process_many.assert_called_once()
 
         schedule.refresh_from_db()
         assert not schedule.is_active
 
-    def test__process_one_interval(self, mocker):
-        schedule_process = mocker.patch.object(Schedule, "process")
+    def test__process_interval(self, mocker):
+        process_many = mocker.patch.object(Schedule, "process_many")
 
         schedule = Schedule.objects.create(interval=timedelta(seconds=2))
 
         scheduler = Scheduler()
-        scheduler._process_one(schedule)
-        schedule_process.assert_called_once()
+        scheduler._process()
+        process_many.assert_called_once()
 
         schedule.refresh_from_db()
         assert schedule.is_active
         assert schedule.next_run_at is not None
 
-    def test__process_one_cron(self, mocker):
-        schedule_process = mocker.patch.object(Schedule, "process")
+    def test__process_cron(self, mocker):
+        process_many = mocker.patch.object(Schedule, "process_many")
 
         schedule = Schedule.objects.create(cron="* * * * *")
 
         scheduler = Scheduler()
-        scheduler._process_one(schedule)
-        schedule_process.assert_called_once()
+        scheduler._process()
+        process_many.assert_called_once()
 
         schedule.refresh_from_db()
         assert schedule.is_active
         assert schedule.next_run_at is not None
+
+    def test__process_misfire_run_all(self):
+        Schedule.objects.create(func="func", cron="* * * * *", next_run_at=timezone.now() - timedelta(minutes=10),
+                                max_catch_up=3)
+
+        scheduler = Scheduler()
+        scheduler._process()
+
+        assert Task.objects.count() == 3
+        schedule = Schedule.objects.get()
+        assert schedule.next_run_at > timezone.now()
+
+    def test__process_misfire_coalesce(self):
+        Schedule.objects.create(func="func", cron="* * * * *", next_run_at=timezone.now() - timedelta(days=1),
+                                misfire_policy=MisfirePolicy.COALESCE)
+
+        scheduler = Scheduler()
+        scheduler._process()
+
+        assert Task.objects.count() == 1
+        schedule = Schedule.objects.get()
+        assert schedule.next_run_at > timezone.now()
+
+    def test__process_misfire_skip(self):
+        Schedule.objects.create(func="func", cron="* * * * *", next_run_at=timezone.now() - timedelta(days=1),
+                                misfire_policy=MisfirePolicy.SKIP)
+
+        scheduler = Scheduler()
+        scheduler._process()
+
+        assert Task.objects.count() == 0
+        schedule = Schedule.objects.get()
+        assert schedule.next_run_at > timezone.now()
+        assert schedule.last_run_at is None
+
+    def test_timer(self):
+        now = timezone.now()
+        s1 = Schedule.objects.create(func="func", interval=timedelta(hours=1), next_run_at=now - timedelta(seconds=1))
+        s2 = Schedule.objects.create(func="func", interval=timedelta(hours=1), next_run_at=now + timedelta(minutes=5))
+        Schedule.objects.create(func="func", interval=timedelta(hours=1), is_active=False)
+
+        scheduler = Scheduler(timer=True)
+        scheduler._resync()
+        assert scheduler._head() == (s1.next_run_at, s1.pk)
+
+        scheduler._process()
+        assert scheduler._head() == (s2.next_run_at, s2.pk)
+        assert Task.objects.count() == 1
+
+        s2.next_run_at = now + timedelta(minutes=1)
+        s2.save()
+        scheduler._refresh({s2.pk})
+        assert scheduler._head() == (s2.next_run_at, s2.pk)
+
+        Schedule.objects.filter(pk=s2.pk).delete()
+        scheduler._refresh({s2.pk})
+        assert scheduler._head()[1] == s1.pk
+
+    def test_standby(self, mocker):
+        _process = mocker.patch.object(Scheduler, "_process")
+
+        scheduler = Scheduler(leader_election=True)
+        mocker.patch.object(scheduler, "_sleep", side_effect=lambda: scheduler._stop_event.set())
+        scheduler._run()
+        _process.assert_not_called()
+        assert not scheduler.is_active()
+
+    def test__process_sharding(self, mocker):
+        Schedule.objects.create(func="func", interval=timedelta(hours=1), shard=10)
+        Schedule.objects.create(func="func", interval=timedelta(hours=1), shard=1000)
+
+        scheduler = Scheduler(sharding=True)
+        mocker.patch.object(scheduler._membership, "_shard_range", (0, 512))
+        scheduler._process()
+
+        assert Task.objects.count() == 1
+        assert Schedule.objects.get(shard=1000).last_run_at is None
+
+    def test__process_cron_spread(self, mocker):
+        mocker.patch.object(Schedule, "process_many")
+
+        schedule = Schedule.objects.create(cron="0 * * * *", spread=timedelta(minutes=10))
+        offset = schedule.spread_offset(schedule.spread)
+        assert timedelta(0) <= offset < timedelta(minutes=10)
+        assert offset == Schedule.objects.get(pk=schedule.pk).spread_offset(schedule.spread)
+
+        scheduler = Scheduler()
+        scheduler._process_many([schedule])
+        first = schedule.next_run_at
+        assert first - offset == first.replace(minute=0, second=0, microsecond=0)
+
+        scheduler._process_many([schedule])
+        assert schedule.next_run_at - first == timedelta(hours=1)
+
+    def test__update_fields(self, mocker):
+        assert Scheduler()._update_fields() == ["is_active", "next_run_at", "last_run_at"]
+
+        def process(schedule):
+            schedule.max_attempts = 5
+
+        # the fields changed by process() of a custom model are saved too
+        mocker.patch.object(SomeSchedule, "process", process)
+        schedule = SomeSchedule.objects.create(max_attempts=1, interval=timedelta(hours=1))
+        Scheduler(SomeSchedule)._process()
+        schedule.refresh_from_db()
+        assert schedule.max_attempts == 5
+        assert schedule.last_run_at is not None
+
+    def test_backfill_shards(self):
+        from django.apps import apps
+
+        from barn.migration_utils import backfill_shards
+
+        for _ in range(3):
+            SomeSchedule.objects.create(max_attempts=1)
+        SomeSchedule.objects.update(shard=7)
+
+        backfill_shards("stall", "someschedule").code(apps, None)
+
+        assert sorted(SomeSchedule.objects.values_list("shard", flat=True)) == sorted(
+            pk % 1024 for pk in SomeSchedule.objects.values_list("pk", flat=True)
+        )
+
+    def test__process_many_cron_batch(self, mocker):
+        from barn import cron
+
+        mocker.patch.object(Schedule, "process_many")
+        next_fire_times = mocker.patch("barn.scheduler.next_fire_times", wraps=cron.next_fire_times)
+        for _ in range(3):
+            Schedule.objects.create(func="func", cron="0 * * * *")
+        Schedule.objects.create(func="func", interval=timedelta(hours=1))
+
+        Scheduler()._process()
+
+        next_fire_times.assert_called_once()
+        assert len(next_fire_times.call_args.args[0]) == 3
+        assert not Schedule.objects.filter(next_run_at__lt=timezone.now()).exists()
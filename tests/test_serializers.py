@@ -0,0 +1,125 @@
+import json
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from barn.decorators import apply_async
+from barn.management.commands import barnbench
+from barn.models import Task, TaskStatus
+from barn.serializers import COMPRESSION_NONE, COMPRESSION_ZLIB, JsonSerializer, PayloadCodec
+from barn.worker import Worker
+
+
+def echo(**kwargs) -> dict:
+    return kwargs
+
+
+class TestPayloadCodec:
+    def test_json(self):
+        codec = PayloadCodec(JsonSerializer())
+        data = codec.dumps({"a": [1, 2, 3]})
+        assert data[:2] == bytes((JsonSerializer.format, COMPRESSION_NONE))
+        assert codec.loads(data) == {"a": [1, 2, 3]}
+
+    def test_zlib(self):
+        codec = PayloadCodec(JsonSerializer(), "zlib", threshold=100)
+        value = {"ids": list(range(1000))}
+        data = codec.dumps(value)
+        assert data[1] == COMPRESSION_ZLIB
+        assert len(data) < len(JsonSerializer().dumps(value))
+        assert codec.loads(memoryview(data)) == value
+        assert codec.dumps({"a": 1})[1] == COMPRESSION_NONE
+
+    def test_msgpack(self):
+        pytest.importorskip("msgpack")
+        from barn.serializers import MsgpackSerializer
+
+        codec = PayloadCodec(MsgpackSerializer(), "zlib", threshold=0)
+        value = {"a": [1, "b", None, True, 1.5]}
+        assert codec.loads(codec.dumps(value)) == value
+        # the data of the other built-in serializer is still readable
+        assert codec.loads(PayloadCodec(JsonSerializer()).dumps(value)) == value
+
+    def test_unknown_compression(self):
+        with pytest.raises(ImproperlyConfigured):
+            PayloadCodec(JsonSerializer(), "lzma")
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTaskPayload:
+    def test_binary_columns(self, settings):
+        settings.BARN_TASK_SERIALIZER = "barn.serializers.JsonSerializer"
+        settings.BARN_TASK_COMPRESSION = "zlib"
+        settings.BARN_TASK_COMPRESSION_THRESHOLD = 0
+
+        task = apply_async(echo, args={"ids": [1, 2, 3]})
+        assert task.args == {"ids": [1, 2, 3]}
+
+        args, args_data = Task.objects.values_list("args", "args_data").get()
+        # the JSON column is left empty
+        assert args is None
+        assert bytes(args_data)[1] == COMPRESSION_ZLIB
+
+        Worker()._process_next()
+
+        task = Task.objects.get()
+        assert task.status == TaskStatus.DONE
+        assert task.args == {"ids": [1, 2, 3]}
+        assert task.result == {"ids": [1, 2, 3]}
+        assert Task.objects.values_list("result", flat=True).get() is None
+
+    def test_json_columns(self, settings):
+        settings.BARN_TASK_SERIALIZER = "barn.serializers.JsonSerializer"
+        apply_async(echo, args={"a": 1})
+
+        # the old rows are moved back to the JSON column on save
+        settings.BARN_TASK_SERIALIZER = None
+        Worker()._process_next()
+
+        assert Task.objects.values_list("args", "args_data", "result").get() == ({"a": 1}, None, {"a": 1})
+
+    def test_old_rows(self, settings):
+        apply_async(echo, args={"a": 1})
+
+        # the rows written without a serializer are read from the JSON column
+        settings.BARN_TASK_SERIALIZER = "barn.serializers.JsonSerializer"
+        Worker()._process_next()
+
+        task = Task.objects.get()
+        assert (task.args, task.result) == ({"a": 1}, {"a": 1})
+        assert Task.objects.values_list("result", flat=True).get() is None
+
+    def test_bulk_create(self, settings):
+        settings.BARN_TASK_SERIALIZER = "barn.serializers.JsonSerializer"
+        tasks = Task.objects.bulk_create([Task(func="func", args={"i": i}, run_at=timezone.now()) for i in range(2)], batch_size=1)
+        assert [task.args for task in tasks] == [{"i": 0}, {"i": 1}]
+        assert list(Task.objects.order_by("pk").values_list("args", flat=True)) == [None, None]
+        assert all(Task.objects.values_list("args_data", flat=True))
+        assert [task.args for task in Task.objects.order_by("pk")] == [{"i": 0}, {"i": 1}]
+
+    def test_post_save(self, settings):
+        settings.BARN_TASK_SERIALIZER = "barn.serializers.JsonSerializer"
+        seen = []
+
+        def _on_post_save(sender, instance: Task, **kwargs):
+            seen.append((instance.args, instance.result))
+
+        post_save.connect(_on_post_save, sender=Task)
+        try:
+            apply_async(echo, args={"a": 1})
+            Worker()._process_next()
+        finally:
+            post_save.disconnect(_on_post_save, sender=Task)
+        assert seen == [({"a": 1}, None), ({"a": 1}, {"a": 1})]
+
+    def test_barnbench(self, settings, capsys):
+        settings.BARN_TASK_SERIALIZER = "barn.serializers.JsonSerializer"
+        call_command("barnbench", rate=100, duration=0.1, wait=0, json=True, keep=True)
+        Worker()._process()
+        run = json.loads(capsys.readouterr().out)["run"]
+        # the run is found without the JSON column
+        report = barnbench.Command()._report(run, Task.objects.earliest("run_at").run_at, Task.objects.count())
+        assert report["processed"] == Task.objects.count() > 0
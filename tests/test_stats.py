@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from barn.models import Task, TaskStatus
+from barn.stats import queue_stats
+
+
+@pytest.mark.django_db(transaction=True)
+class TestStats:
+    def test_queue_stats(self):
+        now = timezone.now()
+        Task.objects.create(func="a", run_at=now - timedelta(seconds=30))
+        Task.objects.create(func="a", run_at=now + timedelta(hours=1))
+        Task.objects.create(func="b", run_at=now - timedelta(seconds=10))
+        Task.objects.create(func="b", status=TaskStatus.DONE)
+        Task.objects.create(func="b", status=TaskStatus.FAILED)
+
+        stats = queue_stats(exact=True)
+
+        assert stats["model"] == "barn.task"
+        assert stats["status"] == {TaskStatus.QUEUED: 3, TaskStatus.DONE: 1, TaskStatus.FAILED: 1}
+        assert stats["func"] == {"a": 2, "b": 1}
+        assert stats["queued"] == 3
+        assert stats["due"] == 2
+        assert stats["oldest_run_at"] == now - timedelta(seconds=30)
+        assert stats["lag"] >= 30
+
+    def test_empty(self):
+        stats = queue_stats()
+        assert stats["queued"] == 0
+        assert stats["oldest_run_at"] is None
+        assert stats["lag"] == 0
+
+    def test_cache(self):
+        assert queue_stats(ttl=60)["queued"] == 0
+        Task.objects.create(func="a")
+        assert queue_stats(ttl=60)["queued"] == 0
+        assert queue_stats(ttl=0)["queued"] == 1
@@ -2,6 +2,7 @@ import pytest
 
 from barn.models import Task, TaskStatus
 from barn.worker import Worker
+from tests.stable.stall.models import SomeTask
 
 
 @pytest.mark.django_db(transaction=True)
@@ -51,4 +52,59 @@ class TestWorker:
         assert task.status == TaskStatus.FAILED
         assert code in str(task.error)
 
-        task_process.assert_called_once()
\ No newline at end of file
+        task_process.assert_called_once()
+
+    def test__process_next_with_hint(self, mocker):
+        _process_one = mocker.patch.object(Worker, "_process_one")
+
+        Task.objects.create(func="func1")
+        task2 = Task.objects.create(func="func2")
+
+        worker = Worker()
+        worker.wakeup(task2.pk)
+        worker._process_next()
+        _process_one.assert_called_once_with(task2)
+
+    def test__probe(self):
+        worker = Worker([Task, SomeTask])
+        assert worker._probe() == []
+
+        SomeTask.objects.create()
+        assert worker._probe() == [SomeTask]
+
+        Task.objects.create(func="func")
+        assert set(worker._probe()) == {Task, SomeTask}
+
+    def test__process_checks_before_probe(self, mocker):
+        worker = Worker([Task, SomeTask])
+        calls = []
+        mocker.patch.object(worker._db, "check", side_effect=lambda: calls.append("check"))
+        mocker.patch.object(worker, "_probe", side_effect=lambda: calls.append("probe") or [])
+        worker._process()
+        assert calls == ["check", "probe"]
+
+    def test__process_many_models(self, mocker):
+        _process_one = mocker.patch.object(Worker, "_process_one", side_effect=lambda task: task.delete())
+
+        for _ in range(3):
+            Task.objects.create(func="func")
+        SomeTask.objects.create()
+
+        worker = Worker([Task, SomeTask])
+        assert worker._process() == 4
+        claimed = [type(call.args[0]) for call in _process_one.call_args_list]
+        # the tasks are claimed from the models in turn
+        assert claimed[:2] in ([Task, SomeTask], [SomeTask, Task])
+        assert worker.accepts(SomeTask)
+
+    def test__process_next_with_hint_of_another_model(self, mocker):
+        _process_one = mocker.patch.object(Worker, "_process_one")
+
+        task = Task.objects.create(func="func")
+        some_task = SomeTask.objects.create()
+
+        worker = Worker([Task, SomeTask])
+        worker.wakeup(some_task.pk, SomeTask)
+        worker._process_next(Task)
+        _process_one.assert_called_once_with(task)
+        assert worker._pop_hint(SomeTask) == some_task.pk
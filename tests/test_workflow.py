@@ -0,0 +1,137 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from barn.bulk import cancel_tasks
+from barn.decorators import task
+from barn.models import Task, TaskGroup, TaskStatus
+from barn.worker import Worker
+from barn.workflow import chain, chord, group, signature
+
+
+@task
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+@task
+def fail() -> None:
+    raise RuntimeError("fail")
+
+
+@pytest.mark.django_db(transaction=True)
+class TestWorkflow:
+    def _run(self) -> None:
+        worker = Worker()
+        while worker._process_next():
+            pass
+
+    def test_signature(self):
+        assert add.s(a=1, b=2) == {"func": "test_workflow.add", "args": {"a": 1, "b": 2}}
+        assert signature("app.func") == {"func": "app.func", "args": None}
+
+    def test_chain(self):
+        first = chain(add.s(a=1, b=2), add.s(a=3, b=4), add.s(a=5, b=6))
+        assert first.chain == [add.s(a=3, b=4), add.s(a=5, b=6)]
+        assert Task.objects.count() == 1
+
+        self._run()
+
+        assert list(Task.objects.order_by("pk").values_list("result", flat=True)) == [3, 7, 11]
+
+    def test_chain_stops_on_failure(self):
+        chain(fail.s(), add.s(a=1, b=2))
+
+        self._run()
+
+        assert list(Task.objects.values_list("status", flat=True)) == [TaskStatus.FAILED]
+
+    def test_group(self):
+        with CaptureQueriesContext(connection) as queries:
+            task_group = group([add.s(a=i, b=i) for i in range(3)])
+        assert task_group.pending == 3
+        assert len([q for q in queries if q["sql"].startswith('INSERT INTO "barn_task" ')]) == 1
+
+        self._run()
+
+        task_group.refresh_from_db()
+        assert task_group.pending == 0
+        assert task_group.finished_at is not None
+        assert sorted(task_group.tasks.values_list("result", flat=True)) == [0, 2, 4]
+
+    def test_chord(self):
+        task_group = chord([add.s(a=1, b=1), [add.s(a=2, b=2), add.s(a=3, b=3)]], add.s(a=10, b=10))
+        assert task_group.tasks.count() == 2
+
+        worker = Worker()
+        worker._process_next()
+        task_group.refresh_from_db()
+        assert task_group.pending == 1
+
+        # the next step of the chain stays in the group
+        worker._process_next()
+        task_group.refresh_from_db()
+        assert task_group.pending == 1
+        assert task_group.tasks.count() == 3
+        assert not Task.objects.filter(group__isnull=True).exists()
+
+        self._run()
+
+        task_group.refresh_from_db()
+        assert task_group.pending == 0
+        callback = Task.objects.get(group__isnull=True)
+        assert callback.result == 20
+        assert Task.objects.filter(status=TaskStatus.DONE).count() == 4
+
+    def test_chord_with_failure(self):
+        task_group = chord([add.s(a=1, b=1), fail.s()], add.s(a=10, b=10))
+
+        self._run()
+
+        task_group.refresh_from_db()
+        assert task_group.pending == 0
+        assert task_group.failed == 1
+        assert task_group.finished_at is not None
+        assert Task.objects.count() == 2
+
+    def test_empty_chord(self):
+        chord([], add.s(a=1, b=1))
+        assert Task.objects.get().func == "test_workflow.add"
+        assert TaskGroup.objects.get().finished_at is not None
+
+    def test_broken_chain(self):
+        task_group = chord([[add.s(a=1, b=1), {"args": {}}]], add.s(a=10, b=10))
+
+        # the worker survives and the member is failed and counted by the group
+        assert Worker()._process_next()
+
+        task = Task.objects.get()
+        assert task.status == TaskStatus.FAILED
+        assert "KeyError" in task.error
+        assert not Worker()._process_next()
+        task_group.refresh_from_db()
+        assert (task_group.pending, task_group.failed) == (0, 1)
+        assert task_group.finished_at is not None
+
+    def test_cancel_chord_member(self):
+        task_group = chord([add.s(a=1, b=1), add.s(a=2, b=2)], add.s(a=10, b=10))
+
+        assert add.cancel(a=2, b=2) == 1
+        task_group.refresh_from_db()
+        assert (task_group.pending, task_group.failed) == (1, 1)
+
+        self._run()
+
+        task_group.refresh_from_db()
+        assert task_group.pending == 0
+        assert task_group.finished_at is not None
+        # the callback is skipped as for a failed member
+        assert not Task.objects.filter(args={"a": 10, "b": 10}).exists()
+
+    def test_cancel_chord_members_in_bulk(self):
+        task_group = chord([add.s(a=1, b=1), add.s(a=2, b=2)], add.s(a=10, b=10))
+
+        assert cancel_tasks(Task.objects.all()) == 2
+        task_group.refresh_from_db()
+        assert (task_group.pending, task_group.failed) == (0, 2)
+        assert task_group.finished_at is not None